@@ -1,19 +1,25 @@
 import sys, os
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import asyncio
-from typing import Dict, Any, List
+import json
+import logging
+from typing import Dict, Any, List, Optional
 import google.generativeai as genai
 from langgraph.graph import StateGraph, END
 from typing import Annotated
 from pydantic import BaseModel
 from MCP.notion_mcp_client import NotionMCPClient
 from MCP.markdown_converter import MarkdownConverter
+from Agent.semantic_cache import get_semantic_cache
 from itertools import cycle
+from functools import lru_cache
 from dotenv import load_dotenv
 import re
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 api_keys = []
 i = 1
 while key := os.getenv(f"GOOGLE_API_KEY_{i}"):
@@ -26,11 +32,94 @@ api_key_cycle = cycle(api_keys)
 current_key = next(api_key_cycle)
 genai.configure(api_key=current_key)
 
+# Static system prefix shared by every solve request. Keeping a long,
+# byte-identical prefix ahead of the per-problem suffix lets Gemini's
+# provider-side prompt caching reuse the processed prefix across requests
+# within the cache TTL, cutting input-token latency and cost.
+_SYSTEM_PREFIX = (
+    "Bạn là trợ lý giải toán THPT chi tiết và chính xác, trình bày theo chuẩn "
+    "bài thi tốt nghiệp THPT của Việt Nam.\n\n"
+    "=== QUY TẮC TRÌNH BÀY ===\n"
+    "1. Mọi công thức toán học PHẢI được viết bằng LaTeX với delimiters $ (inline) "
+    "hoặc $$ (display). Không dùng ký hiệu Unicode thay cho LaTeX.\n"
+    "2. Trình bày lời giải từng bước: nêu giả thiết, phương pháp áp dụng, các "
+    "phép biến đổi trung gian, rồi kết luận rõ ràng ở cuối.\n"
+    "3. Với phương trình/bất phương trình: nêu điều kiện xác định trước khi biến "
+    "đổi, kiểm tra nghiệm với điều kiện, và kết luận tập nghiệm.\n"
+    "4. Với bài hình học: dựng hình/ghi tọa độ rõ ràng, nêu định lý được áp dụng "
+    "(Pythagore, Thales, hàm số lượng giác, ...) tại mỗi bước.\n"
+    "5. Với bài xác suất - thống kê: xác định không gian mẫu, biến cố, rồi áp "
+    "dụng công thức; ghi rõ $P(A)$, $E(X)$, $V(X)$ bằng LaTeX.\n"
+    "6. Với bài giải tích: ghi rõ tập xác định, đạo hàm/nguyên hàm trung gian, "
+    "bảng biến thiên nếu cần khảo sát hàm số.\n\n"
+    "=== ĐỊNH DẠNG ĐẦU RA ===\n"
+    "- Dùng $...$ cho công thức nằm trong câu: Giá trị $x = 5$.\n"
+    "- Dùng $$...$$ cho công thức quan trọng đứng riêng dòng:\n"
+    "  $$E(X) = \\sum_{i=1}^{n} x_i \\cdot P(X = x_i)$$\n"
+    "- Không dùng markdown đậm/nghiêng; viết văn xuôi tiếng Việt mạch lạc.\n"
+    "- Nếu bài có nhiều ý (a, b, c) thì giải tuần tự từng ý, đánh dấu rõ ràng.\n"
+    "- Kết thúc bằng phần 'Kết luận:' tóm tắt đáp số.\n\n"
+    "Bài toán cần giải nằm ngay sau phần hướng dẫn này. Hãy giải chi tiết.\n"
+)
+
+@lru_cache(maxsize=8)
+def _get_model(name: str, api_key: str) -> genai.GenerativeModel:
+    """Reuse a single GenerativeModel instance per (model, key) pair."""
+    return genai.GenerativeModel(name, system_instruction=_SYSTEM_PREFIX)
+
+def _rotate_api_key() -> str:
+    """Advance to the next configured Google API key (round-robin)."""
+    global current_key
+    current_key = next(api_key_cycle)
+    genai.configure(api_key=current_key)
+    return current_key
+
+def _is_quota_error(exc: Exception) -> bool:
+    message = str(exc).lower()
+    return "quota" in message or "resource_exhausted" in message or "429" in message
+
+async def _generate_with_rotating_key(model_name: str, prompt: str, stream: bool = False):
+    """Call Gemini, rotating to the next API key on quota errors.
+
+    Tries each configured key at most once so N keys give N× effective
+    quota before the request actually fails.
+    """
+    last_exc: Exception = RuntimeError("Không có GOOGLE_API_KEY nào được cấu hình")
+    for _ in range(max(len(api_keys), 1)):
+        model = _get_model(model_name, current_key)
+        try:
+            return await model.generate_content_async(prompt, stream=stream)
+        except Exception as e:
+            if not _is_quota_error(e):
+                raise
+            last_exc = e
+            logger.warning("Gemini quota error, xoay sang API key tiếp theo: %s", e)
+            _rotate_api_key()
+    raise last_exc
+
+# Single-pass markdown-cleaning alternation (compiled once at import).
+# One scan over the text replaces the previous five separate re.sub passes.
+_RE_MARKERS = re.compile(
+    r"(?P<hdr>^#{1,6}\s*)"
+    r"|(?P<bold>\*\*(?P<bold_text>.*?)\*\*)"
+    r"|(?P<ital>\*(?P<ital_text>.*?)\*)"
+    r"|(?P<bul>^[\*\-]\s+)",
+    re.MULTILINE,
+)
+
+def _strip_marker(m: "re.Match[str]") -> str:
+    if m.group("hdr") is not None or m.group("bul") is not None:
+        return ""
+    if m.group("bold") is not None:
+        return m.group("bold_text")
+    return m.group("ital_text")
+
 # STATE MODEL 
 class AgentState(BaseModel):
     page_id: Annotated[str, "static"]
     problem_text: str = ""
     solution_text: str = ""
+    streamed_to_notion: bool = False
 
 async def clean_marker(state: AgentState) -> AgentState:
     """
@@ -39,15 +128,13 @@ async def clean_marker(state: AgentState) -> AgentState:
     if not state.solution_text:
         return state
 
-    text = state.solution_text
-    text = re.sub(r"^#{1,6}\s*", "", text, flags=re.MULTILINE)
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-    text = re.sub(r"\*(.*?)\*", r"\1", text)
-    text = re.sub(r"^[\*\-]\s+", "", text, flags=re.MULTILINE)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-
+    text = _RE_MARKERS.sub(_strip_marker, state.solution_text)
+    # Fixed-point str.replace matches \n{3,} -> \n\n without regex overhead;
+    # str.replace runs in C and beats the regex engine for this simple rule
+    while "\n\n\n" in text:
+        text = text.replace("\n\n\n", "\n\n")
     state.solution_text = text.strip()
-    print("Solution after cleaning:\n", state.solution_text)
+    logger.debug("Solution after cleaning:\n%s", state.solution_text)
     return state
 
 # STEPS / NODES 
@@ -57,39 +144,121 @@ async def read_problem(state: AgentState, notion: NotionMCPClient) -> AgentState
     problem_texts: List[str] = []
 
     try:
-        blocks_resp = await notion.client.get(
-            f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
-        )
-        blocks_resp.raise_for_status()
-        blocks_data = blocks_resp.json()
-
-        for block in blocks_data.get("results", []):
-            btype = block.get("type")
-            bcontent = block.get(btype, {}) or {}
-            if "rich_text" in bcontent:
-                text = "".join(rt.get("plain_text", "") for rt in bcontent["rich_text"])
-                if text.strip():
-                    problem_texts.append(text)
-            elif btype == "equation":
-                expr = bcontent.get("expression", "")
-                problem_texts.append(f"Equation: {expr}")
+        # Follow cursor pagination so pages with >100 blocks are read fully
+        # (cursors chain, so the fetches themselves are necessarily serial)
+        cursor = None
+        while True:
+            url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
+            if cursor:
+                url += f"&start_cursor={cursor}"
+            blocks_resp = await notion.client.get(url)
+            blocks_resp.raise_for_status()
+            blocks_data = blocks_resp.json()
+
+            for block in blocks_data.get("results", ()):
+                btype = block.get("type")
+                bcontent = block.get(btype) or {}
+                rich_text = bcontent.get("rich_text")
+                if rich_text:
+                    # plain_text is always present alongside rich_text; index
+                    # directly and let the outer try catch schema drift
+                    text = "".join([rt["plain_text"] for rt in rich_text if "plain_text" in rt]).strip()
+                    if text:
+                        problem_texts.append(text)
+                elif btype == "equation":
+                    problem_texts.append("Equation: " + bcontent.get("expression", ""))
+
+            if not blocks_data.get("has_more"):
+                break
+            cursor = blocks_data.get("next_cursor")
     except Exception as e:
         raise RuntimeError(f"Lỗi đọc nội dung: {e}")
 
     state.problem_text = "\n".join(problem_texts)
-    print("Problem extracted:\n", state.problem_text)
+    logger.debug("Problem extracted:\n%s", state.problem_text)
     return state
 
-async def solve_problem(state: AgentState) -> AgentState:
+# Flush cleaned output to Notion in batches of roughly this size while the
+# model is still generating, overlapping Gemini time with Notion writes
+_STREAM_BATCH_CHARS = 2048
+
+async def solve_problem(state: AgentState, notion: Optional[NotionMCPClient] = None) -> AgentState:
     if not state.problem_text.strip():
         raise ValueError("Không có nội dung toán để giải")
-    
-    prompt = f"Hãy giải chi tiết bài toán sau (bằng LaTeX nếu cần):\n{state.problem_text}"
 
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    response = await asyncio.to_thread(model.generate_content, prompt)
+    # Semantic cache: skip the Gemini call on near-duplicate problems.
+    # Construction (model load + re-embed) and lookup (encode) are CPU-bound,
+    # so run them off the event loop
+    cache = await asyncio.to_thread(get_semantic_cache)
+    cached_solution = await asyncio.to_thread(cache.lookup, state.problem_text)
+    if cached_solution is not None:
+        logger.info("Semantic cache hit, bỏ qua gọi Gemini")
+        state.solution_text = cached_solution
+        return state
 
-    state.solution_text = response.text
+    # Only the problem body varies per request; all solving conventions live
+    # in the static system prefix so the cacheable portion stays maximal
+    prompt = state.problem_text
+
+    # Native async API: rides the event loop instead of occupying a worker thread
+    response = await _generate_with_rotating_key("gemini-2.5-flash", prompt, stream=True)
+
+    async def append_batch(previous: Optional[asyncio.Task], content: str):
+        # Chain on the previous write so blocks land in generation order
+        if previous is not None:
+            await previous
+        await notion.update_page(state.page_id, content=content)
+
+    parts: List[str] = []
+    buffer: List[str] = []
+    buffered_len = 0
+    header_sent = False
+    write_task: Optional[asyncio.Task] = None
+
+    async for chunk in response:
+        text = getattr(chunk, "text", "") or ""
+        if not text:
+            continue
+        parts.append(text)
+        if notion is None:
+            continue
+        buffer.append(text)
+        buffered_len += len(text)
+        if buffered_len >= _STREAM_BATCH_CHARS and "\n" in buffer[-1]:
+            # Split at the last newline so markdown markers are less likely
+            # to be cut mid-token by the batch boundary
+            batch, rest = "".join(buffer).rsplit("\n", 1)
+            # Carry an unmatched ** into the next batch so a bold pair that
+            # spans the boundary is still stripped as a pair
+            if batch.count("**") % 2 == 1:
+                carry_idx = batch.rfind("**")
+                rest = batch[carry_idx:] + "\n" + rest
+                batch = batch[:carry_idx]
+            buffer = [rest]
+            buffered_len = len(rest)
+            if batch:
+                cleaned = _RE_MARKERS.sub(_strip_marker, batch)
+                if not header_sent:
+                    cleaned = f"Lời giải:\n{cleaned}"
+                    header_sent = True
+                write_task = asyncio.create_task(append_batch(write_task, cleaned))
+
+    if notion is not None:
+        remainder = "".join(buffer)
+        if remainder.strip():
+            cleaned = _RE_MARKERS.sub(_strip_marker, remainder)
+            if not header_sent:
+                cleaned = f"Lời giải:\n{cleaned}"
+            write_task = asyncio.create_task(append_batch(write_task, cleaned))
+        if write_task is not None:
+            await write_task
+        state.streamed_to_notion = True
+
+    state.solution_text = "".join(parts)
+    # Never cache an empty solution (failed/empty stream); encode + JSON
+    # rewrite run off the loop
+    if state.solution_text.strip():
+        await asyncio.to_thread(cache.store, state.problem_text, state.solution_text)
     return state
 
 async def write_solution(state: AgentState, notion: NotionMCPClient) -> AgentState:
@@ -97,10 +266,15 @@ async def write_solution(state: AgentState, notion: NotionMCPClient) -> AgentSta
     if not state.solution_text:
         raise ValueError("Không có lời giải để ghi")
 
+    if state.streamed_to_notion:
+        # Solution already landed on the page batch-by-batch during streaming
+        logger.info("Solution already streamed to Notion page")
+        return state
+
     md_solution = f"Lời giải:\n{state.solution_text}"
     await notion.update_page(state.page_id, content=md_solution)
 
-    print("Solution written back to Notion page")
+    logger.info("Solution written back to Notion page")
     return state
 
 #  GRAPH ASSEMBLY 
@@ -112,7 +286,7 @@ def build_graph(notion: NotionMCPClient):
         return await read_problem(state, notion)
 
     async def solve_problem_node(state):
-        return await solve_problem(state)
+        return await solve_problem(state, notion)
 
     async def clean_marker_node(state):
         return await clean_marker(state)
@@ -134,34 +308,100 @@ def build_graph(notion: NotionMCPClient):
     graph.set_entry_point("read_problem")
     return graph
 
-async def run_agent(page_id: str):
+async def run_agent(page_ids: List[str], max_concurrency: int = 4):
+    """Solve multiple Notion pages concurrently on a single MCP connection."""
     notion_client = NotionMCPClient("mcp_server.py", NOTION_TOKEN)
     async with notion_client.connect():
         graph = build_graph(notion_client).compile()
-        init_state = AgentState(page_id=page_id)
-        result_state = await graph.ainvoke(init_state)
-        return result_state
+        # Bound concurrency to respect Gemini rate limits
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def solve_page(page_id: str):
+            async with semaphore:
+                return await graph.ainvoke(AgentState(page_id=page_id))
 
-#  RUN MAIN 
+        results = await asyncio.gather(*[solve_page(p) for p in page_ids])
+        return results
+
+async def serve(server_path: str, max_concurrency: int = 4):
+    """Long-lived daemon mode: read page ids line-by-line from stdin.
+
+    Keeps one MCP connection, compiled graph and event loop alive across
+    requests so batch wrappers skip the per-invocation cold start (loop
+    setup, TLS handshakes, graph compilation).
+    """
+    notion_client = NotionMCPClient(server_path, NOTION_TOKEN)
+    async with notion_client.connect():
+        graph = build_graph(notion_client).compile()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        pending = set()
+
+        async def solve_page(page_id: str):
+            async with semaphore:
+                try:
+                    await graph.ainvoke(AgentState(page_id=page_id))
+                    print("Solved:", page_id, flush=True)
+                except Exception as e:
+                    logger.error("Lỗi xử lý page %s: %s", page_id, e)
+
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            # Accept either a bare page id or {"page_id": "..."} per line
+            if line.startswith("{"):
+                try:
+                    page_id = json.loads(line).get("page_id", "")
+                except json.JSONDecodeError:
+                    page_id = ""
+            else:
+                page_id = line
+            if page_id:
+                task = asyncio.create_task(solve_page(page_id))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+#  RUN MAIN
 async def main():
     import argparse
 
     parser = argparse.ArgumentParser()
     default_server = os.path.abspath("/teamspace/studios/this_studio/MCP/mcp_server.py")
     parser.add_argument("--server", default=default_server, help="MCP server command")
-    parser.add_argument("--page", required=True, help="26974e97-008f-80ac-b77d-dbc6a7fe7726")
+    parser.add_argument("--pages", nargs="+", help="26974e97-008f-80ac-b77d-dbc6a7fe7726")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số page xử lý song song tối đa")
+    parser.add_argument("--serve", action="store_true", help="Chạy daemon đọc page id từ stdin")
     args = parser.parse_args()
 
+    if args.serve:
+        await serve(args.server, args.concurrency)
+        return
+
+    if not args.pages:
+        raise SystemExit("Vui lòng truyền --pages hoặc chạy với --serve")
+
     notion_client = NotionMCPClient(args.server, NOTION_TOKEN)
 
     async with notion_client.connect():
         graph = build_graph(notion_client).compile()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def solve_page(page_id: str):
+            async with semaphore:
+                return await graph.ainvoke(AgentState(page_id=page_id))
 
-        init_state = AgentState(page_id=args.page)
-        result_state = await graph.ainvoke(init_state)
+        result_states = await asyncio.gather(*[solve_page(p) for p in args.pages])
 
-        print("Problem:", result_state["problem_text"])
-        print("Solution:", result_state["solution_text"])
+        for result_state in result_states:
+            print("Problem:", result_state["problem_text"])
+            print("Solution:", result_state["solution_text"])
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
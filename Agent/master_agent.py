@@ -1,6 +1,8 @@
 import os
+import re
 import sys
 import asyncio
+import logging
 from typing import Dict, Any, List, Optional
 from enum import Enum
 from datetime import datetime
@@ -8,35 +10,65 @@ from datetime import datetime
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from langgraph.graph import StateGraph, END
-from groq import Groq
+from groq import AsyncGroq
 
 # Ensure project root is on path
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from Agent.math_agent import MathAgentState, build_graph as build_math_graph
-from Agent.research_agent import ResearchAgentState, build_graph as build_research_graph
-from Agent.tools.serper_tool import serper_scholar_search
+# Heavy siblings (math/research graphs, memory managers with embedding
+# models) are imported lazily inside the code paths that need them so a
+# request that only touches one agent does not pay for the rest at startup
 from Agent.tools.llm_router import route_prompt, RoutingDecision
-from Memory.long_term import LongTermMemoryManager
-from Memory.short_term import ShortTermMemory
 
 # Load environment variables first
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
 
+logger = logging.getLogger(__name__)
+
 # =================== Configuration ===================
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-print(f"GROQ_API_KEY found: {bool(GROQ_API_KEY)}")
-groq_client: Optional[Groq] = None
-if GROQ_API_KEY:
-    try:
-        groq_client = Groq(api_key=GROQ_API_KEY)
-        print("Groq client initialized successfully")
-    except Exception as e:
-        print(f"Failed to initialize Groq client: {e}")
-        groq_client = None
-else:
-    print("GROQ_API_KEY not found in environment")
-    groq_client = None
+groq_client: Optional[AsyncGroq] = None
+_groq_client_initialized = False
+
+def get_groq_client() -> Optional[AsyncGroq]:
+    """Build the Groq client on first use (general agent only)."""
+    global groq_client, _groq_client_initialized
+    if not _groq_client_initialized:
+        _groq_client_initialized = True
+        if GROQ_API_KEY:
+            try:
+                groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+                logger.info("Groq client initialized successfully")
+            except Exception as e:
+                logger.warning("Failed to initialize Groq client: %s", e)
+                groq_client = None
+        else:
+            logger.warning("GROQ_API_KEY not found in environment")
+    return groq_client
+
+# Single fused pattern for image paths in OCR prompts (optional Vietnamese/
+# English prefix + filename); case-insensitive so original casing is preserved
+_OCR_PATH_RE = re.compile(
+    r"(?:(?:ảnh|hình|image|file)\s+)?([^\s]+\.(?:jpg|jpeg|png|bmp|tiff))",
+    re.IGNORECASE,
+)
+
+# Fallback-classifier keywords, precomputed once: single tokens go through
+# set intersection, multi-word phrases (and operator fragments) through a
+# substring scan of the lowercased prompt
+_MATH_TOKENS = frozenset({"giải", "toán", "tính"})
+_MATH_PHRASES = ("phương trình", "tính toán", "x^", "=")
+_RESEARCH_TOKENS = frozenset({"news"})
+_RESEARCH_PHRASES = ("nghiên cứu", "tìm hiểu", "thông tin", "tin tức")
+_OCR_TOKENS = frozenset({"ocr", "ảnh", "hình", "image", "scan"})
+
+def _state_get(result_state: Any, key: str) -> Any:
+    """Read a field from a LangGraph result without re-validating the model.
+
+    LangGraph may return either the typed state or a plain dict; rebuilding
+    the pydantic model just to read one attribute re-coerces every field.
+    """
+    return result_state[key] if isinstance(result_state, dict) else getattr(result_state, key)
 
 # =================== Agent Types ===================
 class AgentType(str, Enum):
@@ -63,6 +95,29 @@ class MasterAgentState(BaseModel):
     # Execution trace for UI
     trace: List[Dict[str, Any]] = []
 
+# =================== Compiled Graphs ===================
+# Sub-agent graphs are compiled once per process, on first use; StateGraph
+# compilation (node validation, edge wiring) is too expensive to redo per
+# request, and the lazy import keeps unrelated agents off the startup path
+_math_graph = None
+_research_graph = None
+
+def get_math_graph():
+    """Get the compiled math agent graph, building it on first use."""
+    global _math_graph
+    if _math_graph is None:
+        from Agent.math_agent import build_graph as build_math_graph
+        _math_graph = build_math_graph().compile()
+    return _math_graph
+
+def get_research_graph():
+    """Get the compiled research agent graph, building it on first use."""
+    global _research_graph
+    if _research_graph is None:
+        from Agent.research_agent import COMPILED_GRAPH
+        _research_graph = COMPILED_GRAPH
+    return _research_graph
+
 # =================== Agent Registry ===================
 # Global memory instances (singleton pattern)
 _global_long_term_memory = None
@@ -72,6 +127,7 @@ def get_long_term_memory():
     """Get global long-term memory instance."""
     global _global_long_term_memory
     if _global_long_term_memory is None:
+        from Memory.long_term import LongTermMemoryManager
         _global_long_term_memory = LongTermMemoryManager()
     return _global_long_term_memory
 
@@ -79,6 +135,7 @@ def get_short_term_memory():
     """Get global short-term memory instance."""
     global _global_short_term_memory
     if _global_short_term_memory is None:
+        from Memory.short_term import ShortTermMemory
         _global_short_term_memory = ShortTermMemory()
     return _global_short_term_memory
 
@@ -117,42 +174,41 @@ class AgentRegistry:
             # Skip similar problems display - focus only on the requested problem
             memory_context = ""
             
-            # Run math agent with memory context
-            math_graph = build_math_graph().compile()
-            
+            # Run math agent with memory context (graph compiled on first use)
+            from Agent.math_agent import MathAgentState
+            math_graph = get_math_graph()
+
             # Use short_term_context if available (contains Notion problem), otherwise use user_prompt
             problem_text = state.short_term_context if state.short_term_context else state.user_prompt
-            
+
             math_state = MathAgentState(
                 problem_text=problem_text, 
                 use_research=True
             )
             result_state = await math_graph.ainvoke(math_state)
-            
-            if isinstance(result_state, dict):
-                result_state = MathAgentState(**result_state)
-            
+            solution_text = _state_get(result_state, "solution_text")
+
             # Store the solution in long-term memory
             await self.long_term_memory.store_math_solution(
                 problem=state.user_prompt,
-                solution=result_state.solution_text,
+                solution=solution_text,
                 method="LangGraph + Groq",
                 importance=0.8
             )
-            
+
             # Add assistant response to short-term memory
             self.short_term_memory.add_assistant_message(
-                f"=== LỜI GIẢI TOÁN ===\n{result_state.solution_text}",
+                f"=== LỜI GIẢI TOÁN ===\n{solution_text}",
                 {"agent_type": "math", "memory_stored": True}
             )
-            
+
             state.trace.append({
                 "step": "math_done",
                 "message": "Đã tìm ra lời giải",
                 "timestamp": datetime.now().isoformat()
             })
 
-            return result_state.solution_text
+            return solution_text
         except Exception as e:
             return f"Lỗi khi chạy math agent: {e}"
     
@@ -177,23 +233,33 @@ class AgentRegistry:
                     memory_context += f"{i}. {research['content'][:200]}...\n"
                 memory_context += "\n"
             
-            # Run research agent
-            research_graph = build_research_graph().compile()
+            # Run research agent (graph compiled on first use)
+            from Agent.research_agent import ResearchAgentState
+            research_graph = get_research_graph()
             research_state = ResearchAgentState(question=state.user_prompt)
+
+            # Reuse the search kicked off speculatively during routing
+            spec_task = _speculative_search.pop(state.user_prompt, None)
+            if spec_task is not None:
+                try:
+                    prefetched = await spec_task
+                    if prefetched:
+                        research_state.research_results = prefetched
+                except Exception:
+                    pass
+
             result_state = await research_graph.ainvoke(research_state)
-            
-            if isinstance(result_state, dict):
-                result_state = ResearchAgentState(**result_state)
-            
+            answer = _state_get(result_state, "answer")
+
             # Extract sources from research result
             sources = []
-            if "Sources:" in result_state.answer:
-                sources_section = result_state.answer.split("Sources:")[1]
+            if "Sources:" in answer:
+                sources_section = answer.split("Sources:")[1]
                 sources = [line.strip() for line in sources_section.split('\n') if line.strip()]
-            
+
             # Store research findings in long-term memory
             await self.long_term_memory.store_memory(
-                content=f"Topic: {state.user_prompt}\nFindings: {result_state.answer}\nSources: {', '.join(sources)}",
+                content=f"Topic: {state.user_prompt}\nFindings: {answer}\nSources: {', '.join(sources)}",
                 memory_type="research",
                 importance=0.7,
                 tags=["research", "findings"],
@@ -203,7 +269,7 @@ class AgentRegistry:
             
             # Add assistant response to short-term memory
             self.short_term_memory.add_assistant_message(
-                f"=== KẾT QUẢ NGHIÊN CỨU ===\n{result_state.answer}",
+                f"=== KẾT QUẢ NGHIÊN CỨU ===\n{answer}",
                 {"agent_type": "research", "memory_stored": True}
             )
             
@@ -213,32 +279,21 @@ class AgentRegistry:
     
     async def _run_ocr_agent(self, state: MasterAgentState) -> str:
         """Run OCR agent for image processing requests"""
-        # Extract image path from prompt if available
-        prompt_lower = state.user_prompt.lower()
-        image_path = None
-        
-        # Look for common image path patterns
-        import re
-        path_patterns = [
-            r'ảnh\s+([^\s]+\.(jpg|jpeg|png|bmp|tiff))',
-            r'hình\s+([^\s]+\.(jpg|jpeg|png|bmp|tiff))',
-            r'image\s+([^\s]+\.(jpg|jpeg|png|bmp|tiff))',
-            r'file\s+([^\s]+\.(jpg|jpeg|png|bmp|tiff))',
-            r'([^\s]+\.(jpg|jpeg|png|bmp|tiff))'
-        ]
-        
-        for pattern in path_patterns:
-            match = re.search(pattern, prompt_lower)
-            if match:
-                image_path = match.group(1)
-                break
-        
+        # Extract image path from prompt if available; search the original
+        # prompt so filename casing is preserved
+        match = _OCR_PATH_RE.search(state.user_prompt)
+        image_path = match.group(1) if match else None
+
         if not image_path:
             return "=== OCR AGENT ===\nOCR agent cần đường dẫn ảnh cụ thể. Vui lòng cung cấp đường dẫn file ảnh để xử lý.\n\nVí dụ: 'Xử lý ảnh image.jpg' hoặc 'OCR file document.png'"
         
-        # Check if file exists
-        if not os.path.exists(image_path):
+        # Single stat syscall covers existence, file-vs-dir and size at once
+        try:
+            file_stat = os.stat(image_path)
+        except OSError:
             return f"=== OCR AGENT ===\nKhông tìm thấy file ảnh: {image_path}\nVui lòng kiểm tra đường dẫn file."
+        if file_stat.st_size == 0:
+            return f"=== OCR AGENT ===\nFile ảnh rỗng: {image_path}\nVui lòng kiểm tra lại file."
         
         try:
             # Import OCR components
@@ -254,14 +309,14 @@ class AgentRegistry:
             client = VinternClient(api_url)
             
             # Wait for OCR API to be ready
-            print("Đợi OCR API sẵn sàng…")
+            logger.info("Đợi OCR API sẵn sàng…")
             health = wait_until_ready(api_url)
-            print("Health check:", health)
-            
+            logger.info("Health check: %s", health)
+
             # Upload image to OCR server
-            print("Upload ảnh:", image_path)
+            logger.info("Upload ảnh: %s", image_path)
             resp = client.upload_image(image_path)
-            print("Raw resp:", resp)
+            logger.debug("Raw resp: %s", resp)
             
             if resp.get("status") != "ok":
                 return f"=== OCR AGENT ===\nLỗi OCR: {resp.get('msg', resp)}"
@@ -295,9 +350,9 @@ class AgentRegistry:
                     async with notion_client.connect():
                         text_block = f"Kết quả OCR từ {image_path}:\n\n{ocr_text}"
                         await notion_client.update_page(page_id, content=text_block)
-                        print("Đã ghi OCR vào Notion page:", page_id)
+                        logger.info("Đã ghi OCR vào Notion page: %s", page_id)
                 except Exception as e:
-                    print(f"Không thể ghi vào Notion: {e}")
+                    logger.warning("Không thể ghi vào Notion: %s", e)
             
             return f"=== OCR AGENT ===\nKết quả OCR từ {image_path}:\n\n{ocr_text}"
             
@@ -306,7 +361,8 @@ class AgentRegistry:
     
     async def _run_general_agent(self, state: MasterAgentState) -> str:
         """Run general agent using Groq for other questions"""
-        if groq_client is None:
+        client = get_groq_client()
+        if client is None:
             return "=== TRỢ LÝ TỔNG QUÁT ===\n(GROQ chưa cấu hình) Tôi có thể giúp bạn với các câu hỏi tổng quát khi có API key."
         
         try:
@@ -350,16 +406,17 @@ class AgentRegistry:
             # Add user question
             context_messages.append({"role": "user", "content": state.user_prompt})
             
-            completion = groq_client.chat.completions.create(
+            # Async streaming keeps the event loop free for other agents
+            completion = await client.chat.completions.create(
                 model="openai/gpt-oss-20b",
                 messages=context_messages,
                 temperature=0.7,
                 max_completion_tokens=1024,
                 stream=True
             )
-            
+
             result_parts = []
-            for chunk in completion:
+            async for chunk in completion:
                 delta = getattr(chunk.choices[0], "delta", None)
                 if delta and getattr(delta, "content", None):
                     result_parts.append(delta.content)
@@ -388,9 +445,27 @@ class AgentRegistry:
             return f"Lỗi khi chạy general agent: {e}"
 
 # =================== Master Agent Nodes ===================
+# Speculative web searches started during routing, keyed by prompt; the
+# research agent picks them up so the DDG round-trip hides behind the
+# (similarly slow) LLM routing call
+_speculative_search: Dict[str, "asyncio.Task"] = {}
+
+
+def _looks_like_research(prompt: str) -> bool:
+    """Cheap pre-check before firing a speculative web search.
+
+    Reuses the fallback classifier's research keywords — a miss just means
+    the research agent does its own (non-overlapped) search."""
+    prompt_lower = prompt.lower()
+    return bool(
+        set(prompt_lower.split()) & _RESEARCH_TOKENS
+        or any(phrase in prompt_lower for phrase in _RESEARCH_PHRASES)
+    )
+
+
 async def analyze_prompt(state: MasterAgentState) -> MasterAgentState:
     """Analyze user prompt using semantic router for intelligent routing"""
-    print(f"--- Analyzing Prompt: {state.user_prompt} ---")
+    logger.info("Analyzing prompt: %s", state.user_prompt)
     
     # Initialize trace with copy
     trace = list(state.trace)
@@ -400,10 +475,22 @@ async def analyze_prompt(state: MasterAgentState) -> MasterAgentState:
         "timestamp": datetime.now().isoformat()
     })
     
+    # Kick off the web search speculatively while the router thinks, but only
+    # for prompts that already look research-y: firing DDG (and importing the
+    # research agent) for every math/OCR prompt wastes sockets and defeats the
+    # lazy import. If the router disagrees the task is simply cancelled
+    spec_task: Optional[asyncio.Task] = None
+    if _looks_like_research(state.user_prompt):
+        try:
+            from Agent.research_agent import ddg_search
+            spec_task = asyncio.create_task(ddg_search(state.user_prompt, max_results=6))
+        except Exception:
+            spec_task = None
+
     try:
         # Use semantic router for advanced analysis
         routing_decision = await route_prompt(state.user_prompt)
-        
+
         state.agent_type = AgentType(routing_decision.agent_type)
         state.reasoning = routing_decision.reasoning
         state.confidence = routing_decision.confidence
@@ -413,28 +500,32 @@ async def analyze_prompt(state: MasterAgentState) -> MasterAgentState:
         else:
             state.context_analysis = {"reasoning": routing_decision.reasoning}
         
-        print(f"Chọn agent: {state.agent_type.value} (độ tin cậy: {state.confidence:.2f})")
-        print(f"Lý do: {state.reasoning}")
-        
+        logger.info("Chọn agent: %s (độ tin cậy: %.2f)", state.agent_type.value, state.confidence)
+        logger.info("Lý do: %s", state.reasoning)
+
         # Show detailed analysis if confidence is low
         if state.confidence < 0.6:
-            print("Độ tin cậy thấp, có thể cần xem xét lại")
+            logger.debug("Độ tin cậy thấp, có thể cần xem xét lại")
             if hasattr(routing_decision, 'context_analysis') and isinstance(routing_decision.context_analysis, dict):
                 scores = routing_decision.context_analysis.get("scores", {})
                 for agent, score_info in scores.items():
-                    print(f"   {agent}: {score_info['score']:.2f} (semantic: {score_info['semantic']:.2f}, keyword: {score_info['keyword']:.2f})")
-        
+                    logger.debug(
+                        "   %s: %.2f (semantic: %.2f, keyword: %.2f)",
+                        agent, score_info['score'], score_info['semantic'], score_info['keyword']
+                    )
+
     except Exception as e:
         # Fallback to simple keyword matching
-        print(f"Lỗi semantic router: {e}, chuyển sang phân tích đơn giản")
+        logger.warning("Lỗi semantic router: %s, chuyển sang phân tích đơn giản", e)
         prompt_lower = state.user_prompt.lower()
-        if any(word in prompt_lower for word in ["giải", "phương trình", "toán", "tính", "tính toán", "x^", "="]):
+        prompt_tokens = set(prompt_lower.split())
+        if prompt_tokens & _MATH_TOKENS or any(phrase in prompt_lower for phrase in _MATH_PHRASES):
             state.agent_type = AgentType.MATH
             state.reasoning = "Phát hiện từ khóa toán học"
-        elif any(word in prompt_lower for word in ["nghiên cứu", "tìm hiểu", "thông tin", "tin tức", "news"]):
+        elif prompt_tokens & _RESEARCH_TOKENS or any(phrase in prompt_lower for phrase in _RESEARCH_PHRASES):
             state.agent_type = AgentType.RESEARCH
             state.reasoning = "Phát hiện từ khóa nghiên cứu"
-        elif any(word in prompt_lower for word in ["ocr", "ảnh", "hình", "image", "scan"]):
+        elif prompt_tokens & _OCR_TOKENS:
             state.agent_type = AgentType.OCR
             state.reasoning = "Phát hiện từ khóa OCR"
         else:
@@ -443,8 +534,18 @@ async def analyze_prompt(state: MasterAgentState) -> MasterAgentState:
         
         state.confidence = 0.5
         state.context_analysis = {"fallback": True}
-        print(f"Chọn agent: {state.agent_type.value} - {state.reasoning}")
-    
+        logger.info("Chọn agent: %s - %s", state.agent_type.value, state.reasoning)
+
+    if spec_task is not None:
+        if state.agent_type == AgentType.RESEARCH:
+            # Cancel any stale task for the same prompt before overwriting it
+            stale = _speculative_search.pop(state.user_prompt, None)
+            if stale is not None:
+                stale.cancel()
+            _speculative_search[state.user_prompt] = spec_task
+        else:
+            spec_task.cancel()
+
     # Log analysis completion
     trace.append({
         "step": "analysis_complete",
@@ -458,6 +559,16 @@ async def analyze_prompt(state: MasterAgentState) -> MasterAgentState:
 # Global registry cache per session
 _session_registries: Dict[str, AgentRegistry] = {}
 
+# Default registry for sessionless calls (built lazily, reused afterwards)
+_default_registry: Optional[AgentRegistry] = None
+
+def get_default_registry() -> AgentRegistry:
+    """Get the shared registry used when no session_id is provided."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = AgentRegistry()
+    return _default_registry
+
 def get_registry_for_session(session_id: str) -> AgentRegistry:
     """Get or create registry for a session with session-specific memory"""
     if session_id not in _session_registries:
@@ -466,7 +577,7 @@ def get_registry_for_session(session_id: str) -> AgentRegistry:
         from Memory.short_term import ShortTermMemory
         registry.short_term_memory = ShortTermMemory()
         _session_registries[session_id] = registry
-        print(f"Created new registry for session: {session_id}")
+        logger.info("Created new registry for session: %s", session_id)
     return _session_registries[session_id]
 
 async def route_to_agent(state: MasterAgentState) -> MasterAgentState:
@@ -492,8 +603,8 @@ async def route_to_agent(state: MasterAgentState) -> MasterAgentState:
     if state.session_id:
         registry = get_registry_for_session(state.session_id)
     else:
-        # Fallback to default registry (for backward compatibility)
-        registry = AgentRegistry()
+        # Fallback to the shared default registry (for backward compatibility)
+        registry = get_default_registry()
     
     if state.agent_type in registry.agents:
         try:
@@ -503,10 +614,17 @@ async def route_to_agent(state: MasterAgentState) -> MasterAgentState:
         except Exception as e:
             state.error = f"Lỗi khi chạy {state.agent_type.value} agent: {e}"
             state.result = f"{state.error}"
+        finally:
+            # The research agent normally pops its prefetch; cancel whatever
+            # is left (agent raised, or routing stored one that was never
+            # consumed) so tasks don't pile up in the dict
+            leftover = _speculative_search.pop(state.user_prompt, None)
+            if leftover is not None:
+                leftover.cancel()
     else:
         state.error = f"Agent {state.agent_type} không tồn tại"
         state.result = f"{state.error}"
-    
+
     return state
 
 async def format_output(state: MasterAgentState) -> MasterAgentState:
@@ -556,6 +674,16 @@ def build_master_graph():
     graph.set_entry_point("analyze_prompt")
     return graph
 
+# Compiled master graph singleton
+_master_graph = None
+
+def get_master_graph():
+    """Get the compiled master graph, building it once per process."""
+    global _master_graph
+    if _master_graph is None:
+        _master_graph = build_master_graph().compile()
+    return _master_graph
+
 # =================== CLI ===================
 async def main():
     import argparse
@@ -564,7 +692,7 @@ async def main():
     parser.add_argument("--prompt", required=True, help="Câu hỏi/yêu cầu của bạn")
     args = parser.parse_args()
     
-    master_graph = build_master_graph().compile()
+    master_graph = get_master_graph()
     init_state = MasterAgentState(user_prompt=args.prompt)
     final_state = await master_graph.ainvoke(init_state)
     
@@ -1,13 +1,39 @@
 import os
+import re
 import sys
+import gzip
+import json
+import time
 import asyncio
-from typing import List, Dict, Optional
+import hashlib
+import logging
+import functools
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from langgraph.graph import StateGraph, END
-from groq import Groq
-import aiohttp
-from bs4 import BeautifulSoup
+from groq import AsyncGroq
+import httpx
+
+# orjson parses the 10-50 KB Serper payloads several times faster than
+# stdlib json; fall back gracefully if it is not installed
+try:
+    import orjson
+
+    def _json_loads(raw: bytes):
+        return orjson.loads(raw)
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+
+    def _json_loads(raw: bytes):
+        return json.loads(raw)
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
 
 # Ensure the project root is on sys.path for script execution
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
@@ -23,29 +49,142 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
 #  Config 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-groq_client: Optional[Groq] = None
+# Async client so streaming does not block the event loop (Serper/Notion
+# I/O can overlap with Groq generation)
+groq_client: Optional[AsyncGroq] = None
 if GROQ_API_KEY:
     try:
-        groq_client = Groq(api_key=GROQ_API_KEY)
+        groq_client = AsyncGroq(api_key=GROQ_API_KEY)
     except Exception:
         groq_client = None
 else:
     groq_client = None
 
 
-#  State 
+# Debug output is opt-in via LOG_LEVEL=DEBUG; print-based dumps cost a
+# slice + stdout flush per call even when nobody is reading them
+logger = logging.getLogger(__name__)
+# getattr guard: an unrecognized LOG_LEVEL falls back to INFO instead of
+# raising at import time
+logger.setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+# Bounded concurrency for external APIs: batched/server-style callers can
+# gather many problems without flooding Groq or Serper
+_GROQ_SEM = asyncio.Semaphore(int(os.getenv("GROQ_MAX_CONCURRENCY", "4")))
+_SERPER_SEM = asyncio.Semaphore(int(os.getenv("SERPER_MAX_CONCURRENCY", "8")))
+
+
+#  State
 class MathAgentState(BaseModel):
+    # validate_assignment stays off so the per-attribute writes in the nodes
+    # skip re-validation; strict mode keeps the fast Rust validator path and
+    # defer_build=False compiles the core schema at import, not first use
+    model_config = ConfigDict(strict=True, validate_assignment=False, defer_build=False)
+
     problem_text: str = ""
     research_results: List[Dict[str, str]] = []
     compiled_context: str = ""
+    prompt_prefix: str = ""
     solution_text: str = ""
     use_research: bool = True
 
 
-#  Research Tool (Serper.dev) 
+#  Research Tool (Serper.dev)
+# Shared client keeps the TCP+TLS connection and DNS cache warm across
+# searches; HTTP/2 lets concurrent queries multiplex one connection.
+# Keyed by running loop: callers like the Flask app do a fresh asyncio.run
+# per HTTP request, and a client outliving its loop fails every later call
+_serper_clients: Dict["asyncio.AbstractEventLoop", httpx.AsyncClient] = {}
+
+def _get_serper_client(timeout_seconds: int) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _serper_clients.get(loop)
+    if client is None or client.is_closed:
+        # Drop entries whose owning loop has closed; their connections are
+        # already dead and can only be garbage-collected
+        for stale in [l for l in _serper_clients if l.is_closed()]:
+            del _serper_clients[stale]
+        kwargs = dict(
+            timeout=httpx.Timeout(timeout_seconds),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+        try:
+            client = httpx.AsyncClient(http2=True, **kwargs)
+        except ImportError:
+            # h2 package not installed; HTTP/1.1 keep-alive pooling still applies
+            client = httpx.AsyncClient(**kwargs)
+        _serper_clients[loop] = client
+    return client
+
+
+async def close_serper_session():
+    """Close the current loop's Serper client (call on shutdown)."""
+    client = _serper_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+# LRU cache over search results so repeated problems skip the network
+# round-trip entirely; keyed by the normalized query plus search params.
+# Each value is (stored_at_timestamp, results); entries are persisted to a
+# gzip-compressed JSON file so repeat CLI runs skip Serper completely.
+_search_cache: "OrderedDict[Tuple[str, int, str, str], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+_SEARCH_CACHE_MAX = 512
+_SEARCH_CACHE_TTL = 86400  # 24h — Scholar results are stable on that scale
+_SEARCH_CACHE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "serper_cache.json.gz"
+)
+_search_cache_loaded = False
+
+
+def _load_search_cache():
+    global _search_cache_loaded
+    if _search_cache_loaded:
+        return
+    _search_cache_loaded = True
+    try:
+        with gzip.open(_SEARCH_CACHE_PATH, "rt", encoding="utf-8") as f:
+            raw = json.load(f)
+    except Exception:
+        return
+    now = time.time()
+    for entry in raw:
+        try:
+            key = tuple(entry["key"])
+            stored_at = float(entry["ts"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if now - stored_at <= _SEARCH_CACHE_TTL:
+            _search_cache[key] = (stored_at, entry.get("results") or [])
+
+
+def _save_search_cache():
+    try:
+        os.makedirs(os.path.dirname(_SEARCH_CACHE_PATH), exist_ok=True)
+        payload = [
+            {"key": list(key), "ts": stored_at, "results": results}
+            for key, (stored_at, results) in _search_cache.items()
+        ]
+        with gzip.open(_SEARCH_CACHE_PATH, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning("Không thể ghi serper cache: %s", e)
+
+
 async def serper_scholar_search(query: str, max_results: int = 6, timeout_seconds: int = 12, gl: str = "vn", hl: str = "vi") -> List[Dict[str, str]]:
     if not SERPER_API_KEY:
         return []
+
+    _load_search_cache()
+    cache_key = (unicodedata.normalize("NFC", query.strip().lower()), max_results, gl, hl)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        stored_at, cached_results = cached
+        if time.time() - stored_at <= _SEARCH_CACHE_TTL:
+            _search_cache.move_to_end(cache_key)
+            return list(cached_results)
+        del _search_cache[cache_key]
+
     url = "https://google.serper.dev/scholar"
     headers = {
         "X-API-KEY": SERPER_API_KEY,
@@ -57,40 +196,125 @@ async def serper_scholar_search(query: str, max_results: int = 6, timeout_second
         "hl": hl,
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, json=payload, headers=headers, timeout=timeout_seconds) as resp:
-                data = await resp.json(content_type=None)
-        except Exception:
-            return []
+    client = _get_serper_client(timeout_seconds)
+    try:
+        async with _SERPER_SEM:
+            resp = await client.post(url, content=_json_dumps(payload), headers=headers)
+        data = _json_loads(resp.content)
+    except Exception:
+        return []
 
     results: List[Dict[str, str]] = []
+    seen: set = set()
     organic = data.get("organic") or []
     for item in organic:
         title = item.get("title") or item.get("name") or ""
         url = item.get("link") or item.get("url") or ""
         snippet = item.get("snippet") or item.get("description") or item.get("abstract") or ""
         if title and url:
+            # Scholar often mirrors the same paper under several entries;
+            # a compact fingerprint of (title, url) drops the duplicates
+            fingerprint = hashlib.blake2b((title + url).encode("utf-8"), digest_size=8).digest()
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
             results.append({"title": title, "url": url, "snippet": snippet})
         if len(results) >= max_results:
             break
+
+    # Only cache non-empty results: empty often means an API error or quota
+    if results:
+        _search_cache[cache_key] = (time.time(), list(results))
+        if len(_search_cache) > _SEARCH_CACHE_MAX:
+            _search_cache.popitem(last=False)
+        # gzip + full-dict JSON dump is CPU/IO work — keep it off the loop
+        await asyncio.to_thread(_save_search_cache)
     return results
 
 
+@functools.lru_cache(maxsize=256)
+def _format_context_entry(title: str, url: str, snippet: str) -> str:
+    """Format a single result (minus its index) — memoized so repeated
+    research hits reuse the stripped/formatted string."""
+    return f"{title.strip()}\n{url.strip()}\n{snippet.strip()}\n"
+
+
 async def build_compiled_context(results: List[Dict[str, str]], max_chars: int = 1800) -> str:
     lines: List[str] = []
+    total_len = 0
     for idx, item in enumerate(results, start=1):
-        title = item.get("title", "").strip()
-        url = item.get("url", "").strip()
-        snippet = item.get("snippet", "").strip()
-        entry = f"[{idx}] {title}\n{url}\n{snippet}\n"
-        lines.append(entry)
-        if sum(len(x) for x in lines) > max_chars:
+        entry = f"[{idx}] " + _format_context_entry(
+            item.get("title", ""), item.get("url", ""), item.get("snippet", "")
+        )
+        # Running counter keeps the budget check O(1) per entry instead of
+        # re-summing the whole list on every iteration
+        if total_len + len(entry) > max_chars and lines:
             break
+        lines.append(entry)
+        total_len += len(entry)
     return "\n".join(lines)
 
 
-#  Nodes 
+#  Prompts (static, built once at import)
+_SYSTEM_PROMPT = (
+    "Bạn là trợ lý giải toán chi tiết và chính xác. BẮT BUỘC sử dụng LaTeX thực sự cho mọi công thức toán học.\n\n"
+    "=== QUY TẮC BẮT BUỘC ===\n"
+    "1. Mọi công thức toán học PHẢI được viết bằng LaTeX với delimiters $ (inline) hoặc $$ (display).\n"
+    "2. TUYỆT ĐỐI KHÔNG sử dụng bất kỳ placeholder nào như LATEXINLINE, LATEXDISPLAY, hoặc bất kỳ biến thể nào.\n"
+    "3. Nếu bạn viết bất kỳ placeholder nào, đó là LỖI NGHIÊM TRỌNG và câu trả lời sẽ bị từ chối.\n\n"
+    "=== VÍ DỤ CÁCH VIẾT ĐÚNG (LÀM THEO ĐÚNG FORMAT NÀY) ===\n"
+    "Ví dụ 1 - Tính toán đơn giản:\n"
+    "Tổng khối lượng là $1 \\times 5 + 2 \\times 2 + 3 \\times 3 = 5 + 4 + 9 = 18$ kg.\n\n"
+    "Ví dụ 2 - Công thức phức tạp:\n"
+    "Khối lượng trung bình được tính bằng:\n"
+    "$$\\bar{x} = \\frac{1 \\times 5 + 2 \\times 2 + 3 \\times 3}{10} = \\frac{18}{10} = 1.8$$\n\n"
+    "Ví dụ 3 - Xác suất:\n"
+    "Xác suất chọn quả có khối lượng 1 là $P(X = 1) = \\frac{5}{10} = 0.5$.\n\n"
+    "Ví dụ 4 - Kỳ vọng:\n"
+    "Kỳ vọng của biến ngẫu nhiên X là:\n"
+    "$$E(X) = \\sum_{i=1}^{3} x_i \\cdot P(X = x_i) = 1 \\times 0.5 + 2 \\times 0.2 + 3 \\times 0.3 = 1.8$$\n\n"
+    "=== VÍ DỤ SAI (TUYỆT ĐỐI KHÔNG LÀM NHƯ VẬY) ===\n"
+    "SAI: Tổng khối lượng là LATEXINLINE4\n"
+    "SAI: Xác suất LATEXDISPLAY\n"
+    "SAI: Khối lượng trung bình: LATEXINLINE\n"
+    "SAI: Kỳ vọng LATEXDISPLAY0\n\n"
+    "=== KHI NÀO DÙNG $ VÀ KHI NÀO DÙNG $$ ===\n"
+    "- Dùng $...$ cho công thức inline trong câu: Giá trị $x = 5$ hoặc $P(X = 1) = 0.5$.\n"
+    "- Dùng $$...$$ cho công thức display riêng dòng:\n"
+    "  $$E(X) = \\sum_{i=1}^{n} x_i \\cdot P(X = x_i)$$\n\n"
+    "=== NHẮC LẠI ===\n"
+    "KHÔNG BAO GIỜ viết LATEXINLINE, LATEXDISPLAY, hoặc bất kỳ placeholder nào. "
+    "LUÔN viết LaTeX thực sự với $ hoặc $$.\n\n"
+    "Nếu có nguồn/công thức từ web research, trích dẫn [n]. Nêu giả thiết, kết luận rõ ràng."
+)
+
+# Plain-string template (not an f-string) so literal LaTeX braces survive;
+# only {solution_text} is substituted at call time
+_FIX_PROMPT_TEMPLATE = (
+    "LỜI GIẢI SAU CÓ LỖI: chứa các placeholder LATEXINLINE/LATEXDISPLAY thay vì LaTeX thực sự.\n\n"
+    "Lời giải có lỗi:\n{solution_text}\n\n"
+    "NHIỆM VỤ: Viết lại TOÀN BỘ lời giải, thay thế MỌI placeholder bằng LaTeX thực sự.\n\n"
+    "QUY TẮC:\n"
+    "- LATEXINLINE hoặc LATEXINLINE4 trong 'Tổng khối lượng LATEXINLINE4' → $1 \\times 5 + 2 \\times 2 + 3 \\times 3 = 18$\n"
+    "- LATEXDISPLAY hoặc LATEXDISPLAY0 trong 'Khối lượng trung bình LATEXDISPLAY0' → $$\\bar{{x}} = \\frac{{18}}{{10}} = 1.8$$\n"
+    "- LATEXINLINE trong 'Xác suất LATEXINLINE' → $P(X = 1) = \\frac{{5}}{{10}} = 0.5$\n"
+    "- LATEXDISPLAY trong 'Kỳ vọng LATEXDISPLAY' → $$E(X) = \\sum_{{i}} x_i \\cdot P(X = x_i)$$\n\n"
+    "Hãy phân tích ngữ cảnh xung quanh mỗi placeholder để suy ra công thức LaTeX đúng, rồi thay thế.\n"
+    "Viết lại TOÀN BỘ lời giải, KHÔNG để lại bất kỳ placeholder nào."
+)
+
+_FIX_SYSTEM_PROMPT = (
+    "Bạn là chuyên gia sửa lỗi LaTeX. Nhiệm vụ của bạn là thay thế MỌI placeholder "
+    "LATEXINLINE/LATEXDISPLAY bằng LaTeX thực sự với delimiters $ hoặc $$. "
+    "Phân tích ngữ cảnh để suy ra công thức đúng. KHÔNG được để lại bất kỳ placeholder nào."
+)
+
+# Single-pass, case-insensitive placeholder scan — avoids allocating an
+# uppercased copy of the whole solution just to run two substring checks
+_PLACEHOLDER_RE = re.compile(r"LATEX(?:INLINE|DISPLAY)", re.IGNORECASE)
+
+
+#  Nodes
 async def read_problem(state: MathAgentState, problem_text: Optional[str] = None) -> MathAgentState:
     if problem_text:
         state.problem_text = problem_text
@@ -100,20 +324,37 @@ async def read_problem(state: MathAgentState, problem_text: Optional[str] = None
     return state
 
 
+async def prepare_prompt(state: MathAgentState) -> str:
+    """Build the research-independent prompt prefix for solve_problem."""
+    return f"Bài toán:\n{state.problem_text}\n\n"
+
+
 async def research_problem(state: MathAgentState) -> MathAgentState:
     query = state.problem_text.strip()
     if not query or not state.use_research:
+        state.prompt_prefix = await prepare_prompt(state)
         return state
-    # Prefer Serper Scholar for higher-quality math references; fallback none
-    results = await serper_scholar_search(query, max_results=6)
+    # Prefer Serper Scholar for higher-quality math references; fallback none.
+    # Prompt preparation does not depend on the search results, so it runs
+    # concurrently and hides behind the Serper round-trip
+    results, prefix = await asyncio.gather(
+        serper_scholar_search(query, max_results=6),
+        prepare_prompt(state),
+    )
     # If SERPER_API_KEY is missing or error, results may be empty
     state.research_results = results
+    state.prompt_prefix = prefix
     state.compiled_context = await build_compiled_context(results)
     print("🔎 Research results:", len(results))
     return state
 
 
-async def solve_problem(state: MathAgentState) -> MathAgentState:
+async def solve_problem(
+    state: MathAgentState,
+    sink: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> MathAgentState:
+    """Generate the solution; if a sink is given, each streamed delta is
+    forwarded to it as it arrives (e.g. for incremental file writes)."""
     if groq_client is None:
         # Fallback if GROQ not configured
         ctx = f"\n\nNguồn tham khảo (nếu có):\n{state.compiled_context}" if state.compiled_context else ""
@@ -121,126 +362,104 @@ async def solve_problem(state: MathAgentState) -> MathAgentState:
         print("Solution (fallback) ready")
         return state
 
-    system_prompt = (
-        "Bạn là trợ lý giải toán chi tiết và chính xác. BẮT BUỘC sử dụng LaTeX thực sự cho mọi công thức toán học.\n\n"
-        "=== QUY TẮC BẮT BUỘC ===\n"
-        "1. Mọi công thức toán học PHẢI được viết bằng LaTeX với delimiters $ (inline) hoặc $$ (display).\n"
-        "2. TUYỆT ĐỐI KHÔNG sử dụng bất kỳ placeholder nào như LATEXINLINE, LATEXDISPLAY, hoặc bất kỳ biến thể nào.\n"
-        "3. Nếu bạn viết bất kỳ placeholder nào, đó là LỖI NGHIÊM TRỌNG và câu trả lời sẽ bị từ chối.\n\n"
-        "=== VÍ DỤ CÁCH VIẾT ĐÚNG (LÀM THEO ĐÚNG FORMAT NÀY) ===\n"
-        "Ví dụ 1 - Tính toán đơn giản:\n"
-        "Tổng khối lượng là $1 \\times 5 + 2 \\times 2 + 3 \\times 3 = 5 + 4 + 9 = 18$ kg.\n\n"
-        "Ví dụ 2 - Công thức phức tạp:\n"
-        "Khối lượng trung bình được tính bằng:\n"
-        "$$\\bar{x} = \\frac{1 \\times 5 + 2 \\times 2 + 3 \\times 3}{10} = \\frac{18}{10} = 1.8$$\n\n"
-        "Ví dụ 3 - Xác suất:\n"
-        "Xác suất chọn quả có khối lượng 1 là $P(X = 1) = \\frac{5}{10} = 0.5$.\n\n"
-        "Ví dụ 4 - Kỳ vọng:\n"
-        "Kỳ vọng của biến ngẫu nhiên X là:\n"
-        "$$E(X) = \\sum_{i=1}^{3} x_i \\cdot P(X = x_i) = 1 \\times 0.5 + 2 \\times 0.2 + 3 \\times 0.3 = 1.8$$\n\n"
-        "=== VÍ DỤ SAI (TUYỆT ĐỐI KHÔNG LÀM NHƯ VẬY) ===\n"
-        "SAI: Tổng khối lượng là LATEXINLINE4\n"
-        "SAI: Xác suất LATEXDISPLAY\n"
-        "SAI: Khối lượng trung bình: LATEXINLINE\n"
-        "SAI: Kỳ vọng LATEXDISPLAY0\n\n"
-        "=== KHI NÀO DÙNG $ VÀ KHI NÀO DÙNG $$ ===\n"
-        "- Dùng $...$ cho công thức inline trong câu: Giá trị $x = 5$ hoặc $P(X = 1) = 0.5$.\n"
-        "- Dùng $$...$$ cho công thức display riêng dòng:\n"
-        "  $$E(X) = \\sum_{i=1}^{n} x_i \\cdot P(X = x_i)$$\n\n"
-        "=== NHẮC LẠI ===\n"
-        "KHÔNG BAO GIỜ viết LATEXINLINE, LATEXDISPLAY, hoặc bất kỳ placeholder nào. "
-        "LUÔN viết LaTeX thực sự với $ hoặc $$.\n\n"
-        "Nếu có nguồn/công thức từ web research, trích dẫn [n]. Nêu giả thiết, kết luận rõ ràng."
+    system_prompt = _SYSTEM_PROMPT
+    # Only spend prompt tokens on the web section when research found something
+    web_section = (
+        f"Web findings (indexed):\n{state.compiled_context}\n\n"
+        if state.compiled_context.strip()
+        else ""
     )
     user_prompt = (
-        f"Bài toán:\n{state.problem_text}\n\n"
-        f"Web findings (indexed):\n{state.compiled_context}\n\n"
-        "Lời giải chi tiết:\n\n"
+        (state.prompt_prefix or f"Bài toán:\n{state.problem_text}\n\n")
+        + web_section
+        + "Lời giải chi tiết:\n\n"
         "LƯU Ý QUAN TRỌNG: Viết MỌI công thức toán học bằng LaTeX với delimiters $ hoặc $$. "
         "KHÔNG BAO GIỜ sử dụng LATEXINLINE, LATEXDISPLAY, hoặc bất kỳ placeholder nào khác. "
         "Ví dụ: Nếu tính tổng khối lượng, viết $1 \\times 5 + 2 \\times 2 + 3 \\times 3 = 18$ "
         "chứ KHÔNG viết LATEXINLINE4."
     )
 
-    # Debug: Log the actual prompts being sent
-    print("=" * 80)
-    print("DEBUG: System prompt (first 500 chars):")
-    print(system_prompt[:500])
-    print("=" * 80)
-    print("DEBUG: User prompt (first 500 chars):")
-    print(user_prompt[:500])
-    print("=" * 80)
+    # Debug: log the actual prompts being sent (slices only computed when
+    # debug logging is actually enabled)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("System prompt (first 500 chars): %s", system_prompt[:500])
+        logger.debug("User prompt (first 500 chars): %s", user_prompt[:500])
 
-    parts: List[str] = []
+    # bytearray gives amortized O(1) appends without building thousands of
+    # intermediate str objects for a join at the end
+    buf = bytearray()
     try:
-        completion = groq_client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.0,  # Use 0 for more deterministic output
-            max_completion_tokens=3000,  # Increase for longer solutions
-            top_p=1,
-            reasoning_effort="medium",
-            stream=True,
-            stop=None,
-        )
-        for chunk in completion:
-            delta = getattr(chunk.choices[0], "delta", None)
-            if delta and getattr(delta, "content", None):
-                parts.append(delta.content)
-        state.solution_text = "".join(parts)
-        
-        # Debug: Log the raw response
-        print("=" * 80)
-        print("DEBUG: Raw LLM response (first 1000 chars):")
-        print(state.solution_text[:1000])
-        print("=" * 80)
+        async with _GROQ_SEM:
+            completion = await groq_client.chat.completions.create(
+                model="openai/gpt-oss-20b",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.0,  # Use 0 for more deterministic output
+                max_completion_tokens=3000,  # Increase for longer solutions
+                top_p=1,
+                reasoning_effort="medium",
+                stream=True,
+                stop=None,
+            )
+            # Scan a sliding window during streaming so a bad generation is
+            # caught after a few tokens instead of after max_completion_tokens.
+            # The window keeps the last ~32 chars to catch placeholders split
+            # across chunk boundaries.
+            window = ""
+            placeholder_seen = False
+            async for chunk in completion:
+                delta = getattr(chunk.choices[0], "delta", None)
+                if delta and getattr(delta, "content", None):
+                    buf.extend(delta.content.encode("utf-8"))
+                    if sink is not None:
+                        await sink(delta.content)
+                    window = window[-32:] + delta.content
+                    if _PLACEHOLDER_RE.search(window):
+                        placeholder_seen = True
+                        try:
+                            await completion.close()
+                        except Exception:
+                            pass
+                        break
+        state.solution_text = buf.decode("utf-8")
         
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw LLM response (first 1000 chars): %s", state.solution_text[:1000])
+
+
         # Post-processing: Check for placeholders and try to fix
-        if 'LATEXINLINE' in state.solution_text.upper() or 'LATEXDISPLAY' in state.solution_text.upper():
-            print("WARNING: LLM returned placeholders instead of LaTeX!")
-            print(f"   Found in solution (first 500 chars): {state.solution_text[:500]}")
-            
+        if placeholder_seen or _PLACEHOLDER_RE.search(state.solution_text):
+            logger.warning("LLM returned placeholders instead of LaTeX!")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Found in solution (first 500 chars): %s", state.solution_text[:500])
+
+
             # Try to fix by asking LLM to replace placeholders with actual LaTeX
             # Use a more aggressive fix prompt with examples
-            fix_prompt = (
-                f"LỜI GIẢI SAU CÓ LỖI: chứa các placeholder LATEXINLINE/LATEXDISPLAY thay vì LaTeX thực sự.\n\n"
-                f"Lời giải có lỗi:\n{state.solution_text}\n\n"
-                f"NHIỆM VỤ: Viết lại TOÀN BỘ lời giải, thay thế MỌI placeholder bằng LaTeX thực sự.\n\n"
-                f"QUY TẮC:\n"
-                f"- LATEXINLINE hoặc LATEXINLINE4 trong 'Tổng khối lượng LATEXINLINE4' → $1 \\times 5 + 2 \\times 2 + 3 \\times 3 = 18$\n"
-                f"- LATEXDISPLAY hoặc LATEXDISPLAY0 trong 'Khối lượng trung bình LATEXDISPLAY0' → $$\\bar{x} = \\frac{18}{10} = 1.8$$\n"
-                f"- LATEXINLINE trong 'Xác suất LATEXINLINE' → $P(X = 1) = \\frac{5}{10} = 0.5$\n"
-                f"- LATEXDISPLAY trong 'Kỳ vọng LATEXDISPLAY' → $$E(X) = \\sum_{i} x_i \\cdot P(X = x_i)$$\n\n"
-                f"Hãy phân tích ngữ cảnh xung quanh mỗi placeholder để suy ra công thức LaTeX đúng, rồi thay thế.\n"
-                f"Viết lại TOÀN BỘ lời giải, KHÔNG để lại bất kỳ placeholder nào."
-            )
-            
+            fix_prompt = _FIX_PROMPT_TEMPLATE.format(solution_text=state.solution_text)
+
             try:
-                fix_completion = groq_client.chat.completions.create(
+                fix_completion = await groq_client.chat.completions.create(
                     model="openai/gpt-oss-20b",
                     messages=[
-                        {"role": "system", "content": (
-                            "Bạn là chuyên gia sửa lỗi LaTeX. Nhiệm vụ của bạn là thay thế MỌI placeholder "
-                            "LATEXINLINE/LATEXDISPLAY bằng LaTeX thực sự với delimiters $ hoặc $$. "
-                            "Phân tích ngữ cảnh để suy ra công thức đúng. KHÔNG được để lại bất kỳ placeholder nào."
-                        )},
+                        {"role": "system", "content": _FIX_SYSTEM_PROMPT},
                         {"role": "user", "content": fix_prompt},
                     ],
                     temperature=0.0,  # Use 0 for deterministic fixing
                     max_completion_tokens=3000,  # Allow longer fixes
                 )
                 fixed_text = fix_completion.choices[0].message.content
-                if fixed_text and ('LATEXINLINE' not in fixed_text.upper() and 'LATEXDISPLAY' not in fixed_text.upper()):
+                if fixed_text and not _PLACEHOLDER_RE.search(fixed_text):
                     state.solution_text = fixed_text
-                    print("Fixed placeholders with actual LaTeX")
+                    logger.info("Fixed placeholders with actual LaTeX")
                 else:
-                    print("Fix attempt still contains placeholders")
-                    print(f"   Fixed text preview: {fixed_text[:300] if fixed_text else 'None'}")
+                    logger.warning("Fix attempt still contains placeholders")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Fixed text preview: %s", fixed_text[:300] if fixed_text else "None")
             except Exception as e:
-                print(f"Could not fix placeholders: {e}")
+                logger.warning("Could not fix placeholders: %s", e)
         
         print("Solution generated")
     except Exception as e:
@@ -295,6 +514,13 @@ def build_graph():
     return graph
 
 
+@functools.lru_cache(maxsize=1)
+def get_compiled_graph():
+    """Build and compile the graph once; the graph is static so repeated
+    invocations (e.g. from a server handler) reuse the same compiled object."""
+    return build_graph().compile()
+
+
 #  CLI 
 async def main():
     import argparse
@@ -314,15 +540,38 @@ async def main():
     if not problem_text.strip():
         raise SystemExit("Vui lòng truyền --problem hoặc --problem_file")
 
-    compiled = build_graph().compile()
     init_state = MathAgentState(problem_text=problem_text, use_research=(not args.no_research))
+
+    if args.output_file:
+        # Stream deltas straight to disk instead of buffering the whole
+        # solution before the first byte hits the file
+        state = await read_problem(init_state)
+        state = await research_problem(state)
+        streamed_parts: List[str] = []
+        with open(args.output_file, "w", buffering=1, encoding="utf-8") as f:
+            f.write("### Lời giải:\n")
+
+            async def file_sink(text: str):
+                streamed_parts.append(text)
+                f.write(text)
+
+            state = await solve_problem(state, sink=file_sink)
+        # The placeholder fix-path may have rewritten the solution after the
+        # stream finished; if so, re-write the file with the corrected text
+        if state.solution_text != "".join(streamed_parts):
+            await write_solution(state, output_file=args.output_file)
+        else:
+            print(f"Solution written to {args.output_file}")
+        return
+
+    compiled = get_compiled_graph()
     final_state = await compiled.ainvoke(init_state)
 
-    # LangGraph may return a plain dict; convert to state model if needed
+    # LangGraph may return a plain dict; the values came straight out of our
+    # own nodes, so skip re-validation with model_construct
     if isinstance(final_state, dict):
-        final_state = MathAgentState(**final_state)
+        final_state = MathAgentState.model_construct(**final_state)
 
-    # write with optional output path
     await write_solution(final_state, output_file=args.output_file)
 
 
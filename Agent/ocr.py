@@ -29,20 +29,15 @@ def format_blocks(resp: dict) -> str:
     if not blocks:
         return resp.get("merged_text", "")
 
-    formatted = []
-    for b in blocks:
-        text = b.get("text", "").strip()
-        btype = b.get("type")
-        if not text:
-            continue
-        if btype == "latex":
-            formatted.append(f"$$\n{text}\n$$")
-        else:
-            # Ghép text OCR: loại bỏ xuống dòng lặt vặt (trừ khi có trắng dòng)
-            lines = [line.strip() for line in text.splitlines()]
-            # gộp các mẩu chữ rời bằng khoảng trắng, bỏ dòng trống
-            joined = " ".join(l for l in lines if l)
-            formatted.append(joined)
+    # str.split() không tham số đã gộp mọi whitespace và bỏ mẩu rỗng trong
+    # một lượt C-level, thay cho pipeline splitlines + strip + filter
+    formatted = [
+        f"$$\n{b.get('text', '').strip()}\n$$"
+        if b.get("type") == "latex"
+        else " ".join(b.get("text", "").split())
+        for b in blocks
+        if b.get("text", "").strip()
+    ]
 
     # Ghép lại các block, mỗi block cách nhau 2 dòng
     return "\n\n".join(formatted)   
@@ -57,6 +52,41 @@ async def write_to_notion(page_id: str, content: str):
         print("Đã ghi OCR vào Notion page:", page_id)
 
 
+async def run(args):
+    client = VinternClient(args.api_url)
+
+    print("Đợi OCR API sẵn sàng…")
+    health = await asyncio.to_thread(wait_until_ready, args.api_url)
+    print("Health check:", health)
+
+    # Upload ảnh tới OCR server; chạy song song với việc khởi động MCP
+    # subprocess + handshake để giấu chi phí startup sau thời gian OCR
+    print("Upload ảnh:", args.image)
+    upload_task = asyncio.create_task(asyncio.to_thread(client.upload_image, args.image))
+
+    notion_client = NotionMCPClient(MCP_SERVER, NOTION_TOKEN)
+    async with notion_client.connect():
+        resp = await upload_task
+        print("Raw resp:", resp)
+
+        if resp.get("status") != "ok":
+            print("Lỗi OCR:", resp.get("msg", resp))
+            return
+
+        # Lấy text từ blocks → format Markdown gọn
+        ocr_text = format_blocks(resp)
+
+        if not ocr_text.strip():
+            print("OCR server không trả về text có thể dùng!")
+            return
+
+        print("\nKết quả OCR (sau format):\n", ocr_text)
+
+        # Ghi ra Notion qua kết nối đã mở sẵn
+        await notion_client.update_page(args.page, content=f"Kết quả OCR:\n\n{ocr_text}")
+        print("Đã ghi OCR vào Notion page:", args.page)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Chạy OCR và ghi kết quả vào Notion")
     parser.add_argument(
@@ -73,32 +103,7 @@ def main():
     )
     args = parser.parse_args()
 
-    client = VinternClient(args.api_url)
-
-    print("Đợi OCR API sẵn sàng…")
-    health = wait_until_ready(args.api_url)
-    print("Health check:", health)
-
-    # Upload ảnh tới OCR server
-    print("Upload ảnh:", args.image)
-    resp = client.upload_image(args.image)
-    print("Raw resp:", resp)
-
-    if resp.get("status") != "ok":
-        print("Lỗi OCR:", resp.get("msg", resp))
-        return
-
-    # Lấy text từ blocks → format Markdown gọn
-    ocr_text = format_blocks(resp)
-
-    if not ocr_text.strip():
-        print("OCR server không trả về text có thể dùng!")
-        return
-
-    print("\nKết quả OCR (sau format):\n", ocr_text)
-
-    # Ghi ra Notion
-    asyncio.run(write_to_notion(args.page, ocr_text))
+    asyncio.run(run(args))
 
 
 if __name__ == "__main__":
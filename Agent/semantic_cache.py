@@ -0,0 +1,142 @@
+import os
+import json
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# Default cache location (survives restarts, shared across agents)
+_DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "solution_cache.json"
+)
+
+# Bound the cache so the embedding matrix and the JSON rewrite stay small;
+# oldest entries are evicted first
+_MAX_ENTRIES = 256
+
+
+class SemanticCache:
+    """Semantic cache for solved problems.
+
+    Embeds problem texts and returns the cached solution when a new problem
+    is a near-duplicate (cosine similarity >= threshold) of one already
+    solved. Entries are persisted to disk as JSON so hits survive restarts.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, similarity_threshold: float = 0.92):
+        self.cache_path = os.path.abspath(cache_path or _DEFAULT_CACHE_PATH)
+        self.similarity_threshold = similarity_threshold
+        self.model: Optional[SentenceTransformer] = None
+        self.entries: List[Dict[str, str]] = []
+        self.embeddings: Optional[np.ndarray] = None
+        self._load_model()
+        self._load_from_disk()
+
+    def _load_model(self):
+        """Load sentence transformer model for semantic similarity"""
+        # Reuse the router's shared model — it is the same checkpoint, and a
+        # second copy would double the ~450 MB of weights in memory
+        try:
+            from Agent.tools.semantic_router import _load_shared_model
+            self.model = _load_shared_model()
+            return
+        except ImportError:
+            pass
+        try:
+            # Same lightweight multilingual model as the semantic router
+            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        except Exception as e:
+            print(f"Không thể load embedding model cho semantic cache: {e}")
+            self.model = None
+
+    def _load_from_disk(self):
+        """Load persisted cache entries and re-embed them"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"Không thể đọc semantic cache: {e}")
+            self.entries = []
+            return
+
+        # Keep only the newest entries if an older, unbounded file is larger
+        # than the cap
+        if len(self.entries) > _MAX_ENTRIES:
+            self.entries = self.entries[-_MAX_ENTRIES:]
+
+        if self.model and self.entries:
+            texts = [entry["problem"] for entry in self.entries]
+            embeddings = self.model.encode(texts, convert_to_numpy=True)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.embeddings = embeddings / norms
+
+    def _save_to_disk(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"Không thể ghi semantic cache: {e}")
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        if not self.model:
+            return None
+        try:
+            embedding = self.model.encode(text, convert_to_numpy=True)
+            norm = np.linalg.norm(embedding)
+            return embedding / norm if norm else embedding
+        except Exception:
+            return None
+
+    def lookup(self, problem_text: str) -> Optional[str]:
+        """Return the cached solution for a near-duplicate problem, or None"""
+        if self.embeddings is None or not len(self.entries):
+            return None
+        query = self._embed(problem_text)
+        if query is None:
+            return None
+        similarities = self.embeddings @ query
+        best_idx = int(np.argmax(similarities))
+        if similarities[best_idx] >= self.similarity_threshold:
+            return self.entries[best_idx]["solution"]
+        return None
+
+    def store(self, problem_text: str, solution_text: str):
+        """Add a solved problem to the cache and persist it"""
+        # An empty solution means the solve failed; persisting it would make
+        # every near-duplicate of this problem "hit" on nothing
+        if not solution_text.strip():
+            return
+        embedding = self._embed(problem_text)
+        if embedding is None:
+            return
+        self.entries.append({
+            "id": str(uuid.uuid4()),
+            "problem": problem_text,
+            "solution": solution_text,
+        })
+        if self.embeddings is None:
+            self.embeddings = embedding[np.newaxis, :]
+        else:
+            self.embeddings = np.vstack([self.embeddings, embedding])
+        # Evict the oldest entry once over the cap, keeping rows and entries
+        # index-aligned
+        if len(self.entries) > _MAX_ENTRIES:
+            self.entries.pop(0)
+            self.embeddings = self.embeddings[1:]
+        self._save_to_disk()
+
+
+# Module-level singleton so the embedding model loads once per process
+_global_cache: Optional[SemanticCache] = None
+
+def get_semantic_cache() -> SemanticCache:
+    """Get global semantic cache instance."""
+    global _global_cache
+    if _global_cache is None:
+        _global_cache = SemanticCache()
+    return _global_cache
@@ -1,30 +1,63 @@
 import os
+import re
 import json
 import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
 from typing import Dict, List, Optional
 from dataclasses import dataclass
-from groq import Groq
+from groq import AsyncGroq
 
-# =================== Configuration ===================
+log = logging.getLogger(__name__)
+
+# orjson parses routing decisions a few times faster than stdlib json
 try:
-    from dotenv import load_dotenv
-    # Load from project root
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    load_dotenv(dotenv_path=os.path.join(project_root, ".env"))
-except Exception as e:
-    print(f"Could not load .env: {e}")
-    pass
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client: Optional[Groq] = None
-if GROQ_API_KEY:
+# Strips a leading ```json / trailing ``` markdown fence in one pass
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.S)
+
+# =================== Configuration ===================
+try:
+    # Parsed once per process, shared with the other agent modules
+    from utils.env import load_env_once
+    load_env_once()
+except ImportError:
     try:
-        groq_client = Groq(api_key=GROQ_API_KEY)
+        from dotenv import load_dotenv
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        load_dotenv(dotenv_path=os.path.join(project_root, ".env"))
     except Exception as e:
-        print(f"Failed to initialize Groq client in LLM router: {e}")
-        groq_client = None
-else:
-    groq_client = None
+        log.warning("Could not load .env: %s", e)
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# AsyncGroq carries an httpx pool bound to the loop it first runs on, so keep
+# one client per running loop: flask_app does a fresh asyncio.run per HTTP
+# request, and a client from the previous loop fails every later call
+_groq_clients: Dict["asyncio.AbstractEventLoop", AsyncGroq] = {}
+
+
+def _get_groq_client() -> Optional[AsyncGroq]:
+    if not GROQ_API_KEY:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _groq_clients.get(loop)
+    if client is None:
+        # Drop clients owned by closed loops; their pools are already dead
+        for stale in [l for l in _groq_clients if l.is_closed()]:
+            del _groq_clients[stale]
+        try:
+            client = AsyncGroq(api_key=GROQ_API_KEY)
+        except Exception as e:
+            log.warning("Failed to initialize Groq client in LLM router: %s", e)
+            return None
+        _groq_clients[loop] = client
+    return client
 
 # =================== Data Structures ===================
 @dataclass
@@ -42,10 +75,64 @@ class RoutingDecision:
     alternative_agents: List[Dict[str, any]]
 
 # =================== LLM Router ===================
+# Plain-string template (braces in the JSON example are doubled);
+# only {agents_desc} and {prompt} are substituted per call
+_ROUTING_PROMPT_TPL = """Bạn là một hệ thống routing thông minh. Nhiệm vụ của bạn là chọn agent phù hợp nhất để xử lý câu hỏi của người dùng.
+
+Các agent có sẵn:
+{agents_desc}
+
+Câu hỏi của người dùng: "{prompt}"
+
+Hãy phân tích và trả lời theo định dạng JSON sau:
+{{
+    "agent": "tên_agent_được_chọn (math/research/ocr/general)",
+    "confidence": số_từ_0_đến_1,
+    "reasoning": "lý do chi tiết tại sao chọn agent này",
+    "alternatives": [
+        {{"agent": "tên_agent", "confidence": số_từ_0_đến_1, "reason": "lý do"}},
+        ...
+    ]
+}}
+
+Quy tắc chọn agent:
+- math: Câu hỏi về toán học, phương trình, tính toán, thống kê
+- research: Câu hỏi cần tìm kiếm thông tin mới, nghiên cứu, tin tức
+- ocr: Yêu cầu xử lý ảnh, nhận dạng văn bản, OCR
+- general: Câu hỏi tổng quát, lập trình, tư vấn, hướng dẫn
+
+Hãy phân tích kỹ và chọn chính xác nhất có thể."""
+
+
 class LLMRouter:
     def __init__(self):
         self.agents = self._initialize_agents()
-    
+        # The agent catalogue is static — render its prompt fragment once
+        self._agents_desc = "".join(
+            f"""
+**{agent_info.name}** ({agent_name}):
+- Mô tả: {agent_info.description}
+- Khả năng: {', '.join(agent_info.capabilities[:3])}...
+- Ví dụ: {', '.join(agent_info.examples[:2])}
+
+"""
+            for agent_name, agent_info in self.agents.items()
+        )
+        # LRU over routing decisions: identical prompts (retries, repeated
+        # questions in a session) skip the Groq round-trip entirely
+        self._route_cache: "OrderedDict[str, RoutingDecision]" = OrderedDict()
+        self._route_cache_max = 1024
+        # Dead-giveaway keywords per agent: prompts matching these skip the
+        # LLM round-trip entirely (regex vs ~300 ms of network)
+        self._fast_patterns: Dict[str, re.Pattern] = {
+            "math": re.compile(
+                r"(phương trình|đạo hàm|tích phân|ma trận|hệ phương trình|xác suất|x\^\d|sin\(|cos\()",
+                re.IGNORECASE,
+            ),
+            "ocr": re.compile(r"\b(ocr|scan|nhận dạng văn bản)\b", re.IGNORECASE),
+            "research": re.compile(r"(tin tức|mới nhất|nghiên cứu về)", re.IGNORECASE),
+        }
+
     def _initialize_agents(self) -> Dict[str, AgentInfo]:
         """Define available agents with their capabilities"""
         return {
@@ -141,6 +228,7 @@ class LLMRouter:
     
     async def _get_llm_routing_decision(self, prompt: str) -> Dict[str, any]:
         """Use Groq LLM to make intelligent routing decision"""
+        groq_client = _get_groq_client()
         if not groq_client:
             return {
                 "agent": "general",
@@ -150,66 +238,71 @@ class LLMRouter:
             }
         
         try:
-            # Create agent descriptions for LLM
-            agents_desc = ""
-            for agent_name, agent_info in self.agents.items():
-                agents_desc += f"""
-**{agent_info.name}** ({agent_name}):
-- Mô tả: {agent_info.description}
-- Khả năng: {', '.join(agent_info.capabilities[:3])}...
-- Ví dụ: {', '.join(agent_info.examples[:2])}
-
-"""
-            
-            routing_prompt = f"""Bạn là một hệ thống routing thông minh. Nhiệm vụ của bạn là chọn agent phù hợp nhất để xử lý câu hỏi của người dùng.
-
-Các agent có sẵn:
-{agents_desc}
-
-Câu hỏi của người dùng: "{prompt}"
-
-Hãy phân tích và trả lời theo định dạng JSON sau:
-{{
-    "agent": "tên_agent_được_chọn (math/research/ocr/general)",
-    "confidence": số_từ_0_đến_1,
-    "reasoning": "lý do chi tiết tại sao chọn agent này",
-    "alternatives": [
-        {{"agent": "tên_agent", "confidence": số_từ_0_đến_1, "reason": "lý do"}},
-        ...
-    ]
-}}
-
-Quy tắc chọn agent:
-- math: Câu hỏi về toán học, phương trình, tính toán, thống kê
-- research: Câu hỏi cần tìm kiếm thông tin mới, nghiên cứu, tin tức
-- ocr: Yêu cầu xử lý ảnh, nhận dạng văn bản, OCR
-- general: Câu hỏi tổng quát, lập trình, tư vấn, hướng dẫn
+            routing_prompt = _ROUTING_PROMPT_TPL.format(
+                agents_desc=self._agents_desc, prompt=prompt
+            )
 
-Hãy phân tích kỹ và chọn chính xác nhất có thể."""
-            
-            completion = groq_client.chat.completions.create(
+            completion = await groq_client.chat.completions.create(
                 model="openai/gpt-oss-20b",
                 messages=[{"role": "user", "content": routing_prompt}],
                 temperature=0.1,  # Low temperature for consistent routing
-                max_completion_tokens=500
+                max_completion_tokens=500,
+                stream=True,
             )
-            
-            response = completion.choices[0].message.content or "{}"
-            
+
+            # Stream and stop as soon as the JSON object closes (brace depth
+            # back to 0 outside strings) — trailing commentary is not needed
+            buf_parts: List[str] = []
+            depth = 0
+            processed = 0
+            end_idx = None
+            in_str = False
+            escaped = False
+            async for chunk in completion:
+                delta = getattr(chunk.choices[0], "delta", None)
+                content = getattr(delta, "content", None) if delta else None
+                if not content:
+                    continue
+                buf_parts.append(content)
+                for i, ch in enumerate(content):
+                    if escaped:
+                        escaped = False
+                    elif in_str:
+                        if ch == "\\":
+                            escaped = True
+                        elif ch == '"':
+                            in_str = False
+                    elif ch == '"':
+                        in_str = True
+                    elif ch == "{":
+                        depth += 1
+                    elif ch == "}" and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            end_idx = processed + i + 1
+                            break
+                processed += len(content)
+                if end_idx is not None:
+                    try:
+                        await completion.close()
+                    except Exception:
+                        pass
+                    break
+
+            response = "".join(buf_parts) or "{}"
+            if end_idx is not None:
+                response = response[:end_idx]
+
             # Clean response - remove any markdown formatting
-            response = response.strip()
-            if response.startswith("```json"):
-                response = response[7:]
-            if response.endswith("```"):
-                response = response[:-3]
-            response = response.strip()
+            response = _FENCE.sub("", response.strip()).strip()
             
             # Fix escape characters
             response = response.replace("\\(", "(").replace("\\)", ")")
             
-            print(f"LLM Response: {response}")  # Debug
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("LLM Response: %s", response)
             
-            result = json.loads(response)
+            result = _json_loads(response)
             
             # Validate and ensure required fields
             if "agent" not in result:
@@ -220,20 +313,39 @@ Hãy phân tích kỹ và chọn chính xác nhất có thể."""
                 result["reasoning"] = "Không có lý do được cung cấp"
             if "alternatives" not in result:
                 result["alternatives"] = []
-            
+            result["ok"] = True
+
             return result
-            
+
         except Exception as e:
-            print(f"LLM routing error: {e}")
+            log.warning("LLM routing error: %s", e)
+            # ok=False: transient failure, must not be cached
             return {
                 "agent": "general",
                 "confidence": 0.3,
                 "reasoning": f"Lỗi LLM routing: {str(e)}",
-                "alternatives": []
+                "alternatives": [],
+                "ok": False
             }
     
     async def route(self, prompt: str) -> RoutingDecision:
         """Main routing method using LLM"""
+        cache_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+        cached = self._route_cache.get(cache_key)
+        if cached is not None:
+            self._route_cache.move_to_end(cache_key)
+            return cached
+
+        # Fast path for obviously-classifiable prompts
+        for agent_name, pattern in self._fast_patterns.items():
+            if pattern.search(prompt):
+                return RoutingDecision(
+                    agent_type=agent_name,
+                    confidence=0.95,
+                    reasoning=f"Từ khóa đặc trưng cho {agent_name} agent",
+                    alternative_agents=[]
+                )
+
         # Get LLM routing decision
         llm_decision = await self._get_llm_routing_decision(prompt)
         
@@ -254,18 +366,34 @@ Hãy phân tích kỹ và chọn chính xác nhất có thể."""
                     "reason": alt.get("reason", "Không có lý do")
                 })
         
-        return RoutingDecision(
+        decision = RoutingDecision(
             agent_type=chosen_agent,
             confidence=llm_decision["confidence"],
             reasoning=llm_decision["reasoning"],
             alternative_agents=alternatives
         )
+        # Only cache real LLM answers; caching the error fallback would pin
+        # the prompt to the general agent long after Groq recovers
+        if llm_decision.get("ok", True):
+            self._route_cache[cache_key] = decision
+            if len(self._route_cache) > self._route_cache_max:
+                self._route_cache.popitem(last=False)
+        return decision
 
 # =================== Usage ===================
+_router: Optional[LLMRouter] = None
+
+def get_router() -> LLMRouter:
+    """Get global LLM router instance (the catalogue is static)."""
+    global _router
+    if _router is None:
+        _router = LLMRouter()
+    return _router
+
+
 async def route_prompt(prompt: str) -> RoutingDecision:
     """Convenience function to route a prompt using LLM"""
-    router = LLMRouter()
-    return await router.route(prompt)
+    return await get_router().route(prompt)
 
 # =================== Testing ===================
 async def test_llm_router():
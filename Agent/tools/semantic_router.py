@@ -4,20 +4,71 @@ import asyncio
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
 import numpy as np
+import httpx
 from sentence_transformers import SentenceTransformer
-from groq import Groq
+from groq import AsyncGroq
+
+# orjson parses JSON several times faster than stdlib json (SIMD UTF-8
+# validation, C parser); fall back silently when not installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Optional SIMD-accelerated cosine kernel; numpy matmul is the fallback.
+# Matters once the router grows past a handful of agent profiles.
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# Optional Aho-Corasick automaton: one linear pass over the prompt scores
+# every agent's keywords at once instead of K substring scans per agent
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # =================== Configuration ===================
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client: Optional[Groq] = None
-if GROQ_API_KEY:
+def _build_groq_http_client() -> httpx.AsyncClient:
+    """Pooled transport with keep-alive so repeated analyses reuse one
+    connection to api.groq.com instead of re-handshaking."""
+    kwargs = dict(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+        timeout=httpx.Timeout(60.0),
+    )
     try:
-        groq_client = Groq(api_key=GROQ_API_KEY)
-    except Exception as e:
-        print(f"Failed to initialize Groq client in semantic router: {e}")
-        groq_client = None
-else:
-    groq_client = None
+        return httpx.AsyncClient(http2=True, **kwargs)
+    except ImportError:
+        # h2 package not installed; HTTP/1.1 keep-alive still applies
+        return httpx.AsyncClient(**kwargs)
+
+
+# Async client so the context analysis can overlap the local scoring.
+# Built lazily, one per running loop: importers that never route should not
+# pay the construction cost at import time, and the pooled transport belongs
+# to the loop that opened it — flask_app runs a fresh asyncio.run per request
+_groq_clients: Dict["asyncio.AbstractEventLoop", AsyncGroq] = {}
+
+
+def _get_groq_client() -> Optional[AsyncGroq]:
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _groq_clients.get(loop)
+    if client is None:
+        # Drop clients owned by closed loops; their pools are already dead
+        for stale in [l for l in _groq_clients if l.is_closed()]:
+            del _groq_clients[stale]
+        try:
+            client = AsyncGroq(api_key=api_key, http_client=_build_groq_http_client())
+        except Exception as e:
+            print(f"Failed to initialize Groq client in semantic router: {e}")
+            return None
+        _groq_clients[loop] = client
+    return client
 
 # =================== Data Structures ===================
 @dataclass
@@ -36,6 +87,38 @@ class RoutingDecision:
     reasoning: str
     context_analysis: Dict[str, any]
 
+# =================== Embedding Model ===================
+# One model per process: weights are ~120 MB, so every SemanticRouter
+# shares the same instance instead of loading its own copy
+_MODEL: Optional[SentenceTransformer] = None
+_MODEL_LOADED = False
+
+
+def _load_shared_model() -> Optional[SentenceTransformer]:
+    global _MODEL, _MODEL_LOADED
+    if _MODEL_LOADED:
+        return _MODEL
+    _MODEL_LOADED = True
+    try:
+        # Use a lightweight multilingual model
+        model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        try:
+            import torch
+            if torch.cuda.is_available():
+                # FP16 halves weight bandwidth; cosine ranking is
+                # insensitive to the lost precision
+                model = model.half().to('cuda')
+            else:
+                torch.set_float32_matmul_precision("medium")
+        except Exception:
+            pass
+        _MODEL = model
+    except Exception as e:
+        print(f"Không thể load embedding model: {e}")
+        _MODEL = None
+    return _MODEL
+
+
 # =================== Semantic Router ===================
 class SemanticRouter:
     def __init__(self):
@@ -43,15 +126,44 @@ class SemanticRouter:
         self.agent_profiles = self._initialize_agent_profiles()
         self._load_embedding_model()
         self._compute_embeddings()
+        self._build_keyword_automaton()
+        # Semantic cache over routing decisions: near-identical prompts
+        # (cosine >= threshold) reuse the previous decision and skip both
+        # the Groq context call and the scoring entirely
+        self._decision_cache_vecs: Optional[np.ndarray] = None
+        self._decision_cache: List[RoutingDecision] = []
+        self._decision_cache_max = 512
+        self._decision_cache_threshold = 0.95
+
+    def _build_keyword_automaton(self):
+        """Compile all agent keywords into one Aho-Corasick automaton"""
+        self._kw_counts = {
+            name: len(profile.keywords) for name, profile in self.agent_profiles.items()
+        }
+        # UTF-8 keyword bytes, encoded once: bytes.find skips the per-check
+        # Unicode machinery in the fallback substring scan
+        self._kw_bytes = {
+            name: tuple(keyword.lower().encode("utf-8") for keyword in profile.keywords)
+            for name, profile in self.agent_profiles.items()
+        }
+        self._kw_automaton = None
+        if ahocorasick is None:
+            return
+        # The same keyword may belong to several agents; each word maps to
+        # the full tuple of owners so one hit credits all of them
+        word_agents: Dict[str, List[str]] = {}
+        for agent_name, profile in self.agent_profiles.items():
+            for keyword in profile.keywords:
+                word_agents.setdefault(keyword.lower(), []).append(agent_name)
+        automaton = ahocorasick.Automaton()
+        for word, agents in word_agents.items():
+            automaton.add_word(word, (word, tuple(agents)))
+        automaton.make_automaton()
+        self._kw_automaton = automaton
     
     def _load_embedding_model(self):
         """Load sentence transformer model for semantic similarity"""
-        try:
-            # Use a lightweight multilingual model
-            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        except Exception as e:
-            print(f"Không thể load embedding model: {e}")
-            self.model = None
+        self.model = _load_shared_model()
     
     def _initialize_agent_profiles(self) -> Dict[str, AgentProfile]:
         """Define comprehensive agent profiles with examples and capabilities"""
@@ -149,16 +261,40 @@ class SemanticRouter:
     
     def _compute_embeddings(self):
         """Compute embeddings for all agent profiles"""
+        self._agent_names: List[str] = list(self.agent_profiles.keys())
+        self._profile_matrix: Optional[np.ndarray] = None
         if not self.model:
             return
-        
-        for agent_name, profile in self.agent_profiles.items():
-            # Combine description, keywords, and examples for embedding
-            text = f"{profile.description} {' '.join(profile.keywords)} {' '.join(profile.examples)}"
-            profile.embedding = self.model.encode(text)
+
+        # Combine description, keywords, and examples per profile, then run
+        # one batched forward pass instead of a per-profile encode loop
+        texts = [
+            f"{profile.description} {' '.join(profile.keywords)} {' '.join(profile.examples)}"
+            for profile in self.agent_profiles.values()
+        ]
+        embs = self.model.encode(
+            texts,
+            batch_size=8,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).astype(np.float32)
+
+        # L2-normalized (N_agents, D) matrix: scoring is a single matmul
+        self._profile_matrix = np.ascontiguousarray(embs)
+        for i, profile in enumerate(self.agent_profiles.values()):
+            profile.embedding = self._profile_matrix[i]
+
+        # int8 copy with per-row scales: halves the bandwidth of the scoring
+        # dot product; ranking error from quantization is negligible
+        scales = np.max(np.abs(self._profile_matrix), axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._profile_scales = scales.astype(np.float32)
+        self._profile_q = np.round(self._profile_matrix / scales[:, None]).astype(np.int8)
     
     async def _analyze_context_with_ai(self, prompt: str) -> Dict[str, any]:
         """Use Groq to analyze context and extract structured information"""
+        groq_client = _get_groq_client()
         if not groq_client:
             return {"intent": "unknown", "domain": "general", "complexity": "medium"}
         
@@ -177,7 +313,7 @@ Phân tích câu hỏi sau và trả lời dạng JSON:
 Câu hỏi: "{prompt}"
 """
             
-            completion = groq_client.chat.completions.create(
+            completion = await groq_client.chat.completions.create(
                 model="openai/gpt-oss-20b",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 temperature=0.3,
@@ -185,32 +321,77 @@ Câu hỏi: "{prompt}"
             )
             
             response = completion.choices[0].message.content or "{}"
-            return json.loads(response)
+            return _json_loads(response)
         except Exception as e:
             return {"intent": "unknown", "domain": "general", "complexity": "medium", "error": str(e)}
     
-    def _calculate_semantic_similarity(self, prompt: str, agent_profile: AgentProfile) -> float:
-        """Calculate semantic similarity between prompt and agent profile"""
-        if not self.model or agent_profile.embedding is None:
-            # Fallback to keyword matching
-            prompt_lower = prompt.lower()
-            matches = sum(1 for keyword in agent_profile.keywords if keyword in prompt_lower)
-            return matches / len(agent_profile.keywords) if agent_profile.keywords else 0
-        
+    def _encode_prompt(self, prompt: str) -> Optional[np.ndarray]:
+        """Encode and L2-normalize the prompt once per route call"""
+        if self.model is None:
+            return None
         try:
-            prompt_embedding = self.model.encode(prompt)
-            similarity = np.dot(prompt_embedding, agent_profile.embedding) / (
-                np.linalg.norm(prompt_embedding) * np.linalg.norm(agent_profile.embedding)
-            )
-            return float(similarity)
+            # normalize_embeddings=True fuses the L2 normalization into
+            # the model's forward pass
+            return self.model.encode(prompt, normalize_embeddings=True).astype(np.float32)
         except Exception:
-            return 0.0
-    
-    def _calculate_keyword_score(self, prompt: str, agent_profile: AgentProfile) -> float:
+            return None
+
+    def _calculate_semantic_scores(self, prompt: str, q: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Cosine scores for all agents from one prompt encode + one matmul"""
+        if q is None:
+            q = self._encode_prompt(prompt)
+        if q is not None and self._profile_matrix is not None:
+            try:
+                if simsimd is not None:
+                    sims = 1.0 - np.asarray(
+                        simsimd.cdist(q[None, :], self._profile_matrix, metric="cosine")
+                    ).ravel()
+                else:
+                    # Quantized int8 dot with per-row rescale
+                    q_scale = float(np.max(np.abs(q))) / 127.0 or 1.0
+                    q_q = np.round(q / q_scale).astype(np.int8)
+                    raw = self._profile_q.astype(np.int32) @ q_q.astype(np.int32)
+                    sims = raw.astype(np.float32) * (self._profile_scales * q_scale)
+                return {name: float(s) for name, s in zip(self._agent_names, sims)}
+            except Exception:
+                pass
+        # Fallback to keyword matching when no embedding model is available
+        prompt_bytes = prompt.lower().encode("utf-8")
+        return {
+            name: self._calculate_keyword_score(prompt_bytes, name)
+            for name in self.agent_profiles
+        }
+
+    def _calculate_keyword_score(self, prompt_bytes: bytes, agent_name: str) -> float:
         """Calculate keyword-based matching score"""
+        keywords = self._kw_bytes.get(agent_name, ())
+        if not keywords:
+            return 0
+        matches = sum(1 for keyword in keywords if keyword in prompt_bytes)
+        return matches / len(keywords)
+
+    def _calculate_keyword_scores(self, prompt: str) -> Dict[str, float]:
+        """Keyword scores for all agents in a single automaton pass"""
+        if self._kw_automaton is None:
+            prompt_bytes = prompt.lower().encode("utf-8")
+            return {
+                name: self._calculate_keyword_score(prompt_bytes, name)
+                for name in self.agent_profiles
+            }
         prompt_lower = prompt.lower()
-        matches = sum(1 for keyword in agent_profile.keywords if keyword in prompt_lower)
-        return matches / len(agent_profile.keywords) if agent_profile.keywords else 0
+        hits = {name: 0 for name in self.agent_profiles}
+        seen = set()
+        for _, (word, agents) in self._kw_automaton.iter(prompt_lower):
+            # Each keyword counts once, matching the substring-scan semantics
+            if word in seen:
+                continue
+            seen.add(word)
+            for agent_name in agents:
+                hits[agent_name] += 1
+        return {
+            name: (hits[name] / self._kw_counts[name]) if self._kw_counts[name] else 0
+            for name in hits
+        }
     
     def _calculate_context_score(self, context: Dict[str, any], agent_name: str) -> float:
         """Calculate score based on context analysis"""
@@ -247,16 +428,48 @@ Câu hỏi: "{prompt}"
         
         return min(score, 1.0)
     
-    async def route(self, prompt: str) -> RoutingDecision:
-        """Main routing method with multi-layered analysis"""
-        # Step 1: Context analysis with AI
-        context = await self._analyze_context_with_ai(prompt)
-        
-        # Step 2: Calculate scores for each agent
+    def _cache_lookup(self, q: Optional[np.ndarray]) -> Optional[RoutingDecision]:
+        """Return a cached decision when a stored prompt is near-identical"""
+        if q is None or self._decision_cache_vecs is None or not len(self._decision_cache):
+            return None
+        # All vectors are L2-normalized, so one matvec gives the cosines
+        sims = self._decision_cache_vecs @ q
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self._decision_cache_threshold:
+            return None
+        # Move the hit to the back so eviction stays least-recently-used
+        decision = self._decision_cache.pop(best)
+        self._decision_cache.append(decision)
+        vec = self._decision_cache_vecs[best]
+        self._decision_cache_vecs = np.vstack(
+            [np.delete(self._decision_cache_vecs, best, axis=0), vec[None, :]]
+        )
+        return decision
+
+    def _cache_store(self, q: Optional[np.ndarray], decision: RoutingDecision):
+        """Insert a fresh decision, evicting the oldest past the cap"""
+        if q is None:
+            return
+        self._decision_cache.append(decision)
+        if self._decision_cache_vecs is None:
+            self._decision_cache_vecs = q[None, :].copy()
+        else:
+            self._decision_cache_vecs = np.vstack([self._decision_cache_vecs, q[None, :]])
+        if len(self._decision_cache) > self._decision_cache_max:
+            self._decision_cache.pop(0)
+            self._decision_cache_vecs = self._decision_cache_vecs[1:]
+
+    def _score_and_decide(
+        self,
+        semantic_scores: Dict[str, float],
+        keyword_scores: Dict[str, float],
+        context: Dict[str, any],
+    ) -> RoutingDecision:
+        """Combine the per-agent scores into a RoutingDecision"""
         agent_scores = {}
         for agent_name, profile in self.agent_profiles.items():
-            semantic_score = self._calculate_semantic_similarity(prompt, profile)
-            keyword_score = self._calculate_keyword_score(prompt, profile)
+            semantic_score = semantic_scores.get(agent_name, 0.0)
+            keyword_score = keyword_scores.get(agent_name, 0.0)
             context_score = self._calculate_context_score(context, agent_name)
             
             # Weighted combination
@@ -287,7 +500,7 @@ Câu hỏi: "{prompt}"
             reasoning_parts.append("Phù hợp với ngữ cảnh")
         
         reasoning = "; ".join(reasoning_parts) if reasoning_parts else "Phân tích tổng hợp"
-        
+
         return RoutingDecision(
             agent_type=agent_name,
             confidence=scores["score"],
@@ -299,8 +512,97 @@ Câu hỏi: "{prompt}"
             }
         )
 
+    async def route(self, prompt: str) -> RoutingDecision:
+        """Main routing method with multi-layered analysis"""
+        # Step 0: Semantic cache — skip the Groq call and all scoring when a
+        # near-identical prompt was already routed
+        q = self._encode_prompt(prompt)
+        cached = self._cache_lookup(q)
+        if cached is not None:
+            return cached
+
+        # Step 1: Kick off the AI context analysis; the network round-trip
+        # overlaps the CPU-bound scoring below instead of serializing with it
+        context_task = asyncio.create_task(self._analyze_context_with_ai(prompt))
+
+        # Step 2: Calculate scores for each agent
+        semantic_scores = self._calculate_semantic_scores(prompt, q)
+        keyword_scores = self._calculate_keyword_scores(prompt)
+        context = await context_task
+
+        # Step 3+4: Combine scores and build the decision. A context carrying
+        # an "error" key came from the degraded fallback — caching it would
+        # replay the failure for every near-identical prompt
+        decision = self._score_and_decide(semantic_scores, keyword_scores, context)
+        if "error" not in context:
+            self._cache_store(q, decision)
+        return decision
+
+    async def route_batch(self, prompts: List[str]) -> List[RoutingDecision]:
+        """Route many prompts at once: one batched encode for all of them
+        and the Groq context analyses fired concurrently (bounded)"""
+        if not prompts:
+            return []
+
+        # Single forward pass amortizes the transformer overhead over the batch
+        q_mat: Optional[np.ndarray] = None
+        if self.model is not None:
+            try:
+                q_mat = self.model.encode(
+                    prompts,
+                    batch_size=32,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                ).astype(np.float32)
+            except Exception:
+                q_mat = None
+
+        decisions: List[Optional[RoutingDecision]] = [None] * len(prompts)
+        pending: List[Tuple[int, str, Optional[np.ndarray]]] = []
+        for i, prompt in enumerate(prompts):
+            q = q_mat[i] if q_mat is not None else None
+            cached = self._cache_lookup(q)
+            if cached is not None:
+                decisions[i] = cached
+            else:
+                pending.append((i, prompt, q))
+
+        # Bound concurrency so a large batch cannot flood the Groq API
+        sem = asyncio.Semaphore(10)
+
+        async def _bounded_analyze(p: str) -> Dict[str, any]:
+            async with sem:
+                return await self._analyze_context_with_ai(p)
+
+        contexts = await asyncio.gather(*[_bounded_analyze(p) for _, p, _ in pending])
+        for (i, prompt, q), context in zip(pending, contexts):
+            semantic_scores = self._calculate_semantic_scores(prompt, q)
+            keyword_scores = self._calculate_keyword_scores(prompt)
+            decision = self._score_and_decide(semantic_scores, keyword_scores, context)
+            if "error" not in context:
+                self._cache_store(q, decision)
+            decisions[i] = decision
+        return decisions
+
 # =================== Usage ===================
+# Singleton: building a SemanticRouter loads the SentenceTransformer and
+# re-encodes every profile — far too costly to repeat per prompt
+_router: Optional[SemanticRouter] = None
+
+def get_router() -> SemanticRouter:
+    """Get global semantic router instance."""
+    global _router
+    if _router is None:
+        _router = SemanticRouter()
+    return _router
+
+
 async def route_prompt(prompt: str) -> RoutingDecision:
     """Convenience function to route a prompt"""
-    router = SemanticRouter()
-    return await router.route(prompt)
+    return await get_router().route(prompt)
+
+
+async def route_batch(prompts: List[str]) -> List[RoutingDecision]:
+    """Convenience function to route many prompts concurrently"""
+    return await get_router().route_batch(prompts)
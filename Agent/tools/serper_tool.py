@@ -1,9 +1,53 @@
 import os
-from typing import List, Dict
+import json
+import asyncio
+from typing import Dict, List
 import aiohttp
 
+# orjson decodes the raw response bytes faster than aiohttp's stdlib-json
+# resp.json(); fall back silently when not installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
+# Shared session keeps Keep-Alive connections and the DNS cache warm so
+# repeated searches skip the TCP+TLS handshake (~50-200 ms each).
+# Keyed by running loop: callers like the Flask app do a fresh asyncio.run
+# per HTTP request, and a session outliving its loop fails every later call
+_SESSIONS: Dict["asyncio.AbstractEventLoop", aiohttp.ClientSession] = {}
+
+# Pre-built timeout for the default case; aiohttp coerces a bare int into
+# a new ClientTimeout per request otherwise
+_TIMEOUT = aiohttp.ClientTimeout(total=12)
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        # Drop entries whose owning loop has closed; their connections are
+        # already dead and can only be garbage-collected
+        for stale in [l for l in _SESSIONS if l.is_closed()]:
+            del _SESSIONS[stale]
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=30),
+            timeout=_TIMEOUT,
+        )
+        _SESSIONS[loop] = session
+    return session
+
+
+async def close_session():
+    """Close the current loop's Serper session (call on shutdown)."""
+    session = _SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
 async def serper_scholar_search(query: str, max_results: int = 6, timeout_seconds: int = 12, gl: str = "vn", hl: str = "vi") -> List[Dict[str, str]]:
     """Call Serper.dev Scholar API and normalize results to {title,url,snippet}."""
     if not SERPER_API_KEY:
@@ -20,12 +64,13 @@ async def serper_scholar_search(query: str, max_results: int = 6, timeout_second
         "hl": hl,
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(url, json=payload, headers=headers, timeout=timeout_seconds) as resp:
-                data = await resp.json(content_type=None)
-        except Exception:
-            return []
+    session = await _get_session()
+    timeout = _TIMEOUT if timeout_seconds == 12 else aiohttp.ClientTimeout(total=timeout_seconds)
+    try:
+        async with session.post(url, json=payload, headers=headers, timeout=timeout) as resp:
+            data = _json_loads(await resp.read())
+    except Exception:
+        return []
 
     results: List[Dict[str, str]] = []
     organic = data.get("organic") or []
@@ -38,5 +83,3 @@ async def serper_scholar_search(query: str, max_results: int = 6, timeout_second
         if len(results) >= max_results:
             break
     return results
-
-
@@ -8,6 +8,14 @@ from notion_mcp_client import NotionMCPClient, NotionMCPCLI
 logger = logging.getLogger("mcp-client")
 logging.basicConfig(level=logging.INFO)
 
+# uvloop (libuv-backed) noticeably speeds up the stdio JSON-RPC chatter and
+# the parallel Notion REST calls; fall back silently where unavailable
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 async def main():
     """Notion MCP Client (JSON-RPC stdio + direct REST for resources)"""
 
@@ -51,13 +59,13 @@ async def main():
                     name = ""
 
                     if rtype == "page":
-                        props = r.get("properties", {})
-                        for prop in props.values():
-                            if prop.get("type") == "title":
-                                titles = prop.get("title", [])
-                                if titles:
-                                    name = titles[0].get("plain_text", "")
-                                break
+                        # Short-circuits on the first title property
+                        title_prop = next(
+                            (p for p in r.get("properties", {}).values() if p.get("type") == "title"),
+                            None,
+                        )
+                        if title_prop and title_prop.get("title"):
+                            name = title_prop["title"][0].get("plain_text", "")
                     elif rtype == "database":
                         titles = r.get("title", [])
                         if titles:
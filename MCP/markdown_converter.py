@@ -1,10 +1,73 @@
 import re
-import mistune
+import functools
 from typing import List, Dict, Any
 
+# Compiled once at import: these run on every conversion, and re.sub with a
+# string pattern pays a cache lookup + arg parsing on each call
+_MATH_BLOCK = re.compile(r"```math(.*?)```", re.DOTALL)
+_MATH_DISPLAY = re.compile(r"\\```math(.*?)\\```", re.DOTALL)
+_MATH_ANY = re.compile(r"```math.*?```|\\```math.*?\\```", re.DOTALL)
+_INLINE = re.compile(r"\$(.+?)\$")
+_DISPLAY_WRAPPER = re.compile(r"\\```math([\s\S]*?)\\```")
+_EQNARRAY_BEGIN = re.compile(r"\\begin\{eqnarray\*?\}")
+_EQNARRAY_END = re.compile(r"\\end\{eqnarray\*?\}")
+_TEXT_CMD = re.compile(r"\\text\{([^}]*)\}")
+_DOLLAR_EDGES = re.compile(r"^\$|\$$")
+_NUM_LIST = re.compile(r"^(\d+)\.\s+(.*)$")
+
+# Block type -> (markdown prefix, trailing blank line). One dict lookup per
+# block instead of walking an if/elif cascade that re-fetches the same keys
+_SIMPLE_BLOCKS = {
+    "paragraph": ("", True),
+    "heading_1": ("# ", True),
+    "heading_2": ("## ", True),
+    "heading_3": ("### ", True),
+    "bulleted_list_item": ("- ", False),
+    "numbered_list_item": ("1. ", False),
+    "quote": ("> ", True),
+}
+
+
+def _fix_mid_in_text(match):
+    text_content = match.group(1)
+    # Replace \mid with | inside text
+    text_content = text_content.replace(r'\mid', '|')
+    return f'\\text{{{text_content}}}'
+
+
+@functools.lru_cache(maxsize=4096)
+def _latex_to_notion(expr: str) -> str:
+    expr = _DISPLAY_WRAPPER.sub(r"\1", expr)
+    expr = _EQNARRAY_BEGIN.sub(r"\\begin{aligned}", expr)
+    expr = _EQNARRAY_END.sub(r"\\end{aligned}", expr)
+
+    # Fix \mid in \text{} - replace with | in text mode
+    # This handles cases like \text{mặt 6 \mid mặt chẵn}
+    # We need to replace \mid with | when inside \text{}
+    expr = _TEXT_CMD.sub(_fix_mid_in_text, expr)
+
+    converted = expr.strip()
+
+    return converted
+
+
+# Line prefix -> Notion block type for the simple one-line constructs;
+# a short tuple scan replaces a per-line elif cascade
+_LINE_PREFIXES = (
+    ("### ", "heading_3"),
+    ("## ", "heading_2"),
+    ("- ", "bulleted_list_item"),
+)
+
+
 class MarkdownConverter:
-    def __init__(self):
-        self.markdown_parser = mistune.create_markdown()
+    @staticmethod
+    def _mk_block(btype: str, content: str) -> Dict[str, Any]:
+        """Build the standard rich_text block shape for the given type"""
+        return {
+            "type": btype,
+            btype: {"rich_text": [{"type": "text", "text": {"content": content}}]},
+        }
 
     def parse_markdown_to_blocks(self, md: str) -> List[Dict[str, Any]]:
         lines = md.strip().split("\n")
@@ -24,57 +87,33 @@ class MarkdownConverter:
         i = content_start_idx
         while i < len(lines):
             line = lines[i]
-            # H2-H6
-            if line.startswith("## "):
-                blocks.append(
-                    {
-                        "type": "heading_2",
-                        "heading_2": {"rich_text": [{"type": "text", "text": {"content": line[3:].strip()}}]},
-                    }
-                )
-            elif line.startswith("### "):
-                blocks.append(
-                    {
-                        "type": "heading_3",
-                        "heading_3": {"rich_text": [{"type": "text", "text": {"content": line[4:].strip()}}]},
-                    }
-                )
-            elif line.startswith("- "):
-                blocks.append(
-                    {
-                        "type": "bulleted_list_item",
-                        "bulleted_list_item": {"rich_text": [{"type": "text", "text": {"content": line[2:].strip()}}]},
-                    }
-                )
-            elif line.strip() and line[0].isdigit() and ". " in line:
-                content = line.split(". ", 1)[1]
-                blocks.append(
-                    {
-                        "type": "numbered_list_item",
-                        "numbered_list_item": {"rich_text": [{"type": "text", "text": {"content": content.strip()}}]},
-                    }
-                )
-            elif line.startswith("```"):
-                code_lines = []
-                language = line[3:].strip()
-                i += 1
-
-                while i < len(lines) and not lines[i].startswith("```"):
-                    code_lines.append(lines[i])
+            # H2-H6 / bullets via the prefix table
+            for prefix, btype in _LINE_PREFIXES:
+                if line.startswith(prefix):
+                    blocks.append(self._mk_block(btype, line[len(prefix):].strip()))
+                    break
+            else:
+                if line.startswith("```"):
+                    code_lines = []
+                    language = line[3:].strip()
                     i += 1
-                blocks.append(
-                    {
-                        "type": "code",
-                        "code": {
-                            "rich_text": [{"type": "text", "text": {"content": "\n".join(code_lines)}}],
-                            "language": language if language else "plain text",
-                        },
-                    }
-                )
-            elif line.strip():
-                blocks.append(
-                    {"type": "paragraph", "paragraph": {"rich_text": [{"type": "text", "text": {"content": line.strip()}}]}}
-                )
+
+                    while i < len(lines) and not lines[i].startswith("```"):
+                        code_lines.append(lines[i])
+                        i += 1
+                    blocks.append(
+                        {
+                            "type": "code",
+                            "code": {
+                                "rich_text": [{"type": "text", "text": {"content": "\n".join(code_lines)}}],
+                                "language": language if language else "plain text",
+                            },
+                        }
+                    )
+                elif (m := _NUM_LIST.match(line)) is not None:
+                    blocks.append(self._mk_block("numbered_list_item", m.group(2).strip()))
+                elif line.strip():
+                    blocks.append(self._mk_block("paragraph", line.strip()))
             i += 1
         return blocks, title
 
@@ -87,33 +126,13 @@ class MarkdownConverter:
         for block in blocks:
             block_type = block.get("type")
 
-            if block_type == "paragraph":
-                text_content = self._extract_text_content(block.get("paragraph", {}).get("rich_text", []))
-                md_lines.append(text_content)
-                md_lines.append("")  
-
-            elif block_type == "heading_1":
-                text_content = self._extract_text_content(block.get("heading_1", {}).get("rich_text", []))
-                md_lines.append(f"# {text_content}")
-                md_lines.append("")
-
-            elif block_type == "heading_2":
-                text_content = self._extract_text_content(block.get("heading_2", {}).get("rich_text", []))
-                md_lines.append(f"## {text_content}")
-                md_lines.append("")
-
-            elif block_type == "heading_3":
-                text_content = self._extract_text_content(block.get("heading_3", {}).get("rich_text", []))
-                md_lines.append(f"### {text_content}")
-                md_lines.append("")
-
-            elif block_type == "bulleted_list_item":
-                text_content = self._extract_text_content(block.get("bulleted_list_item", {}).get("rich_text", []))
-                md_lines.append(f"- {text_content}")
-
-            elif block_type == "numbered_list_item":
-                text_content = self._extract_text_content(block.get("numbered_list_item", {}).get("rich_text", []))
-                md_lines.append(f"1. {text_content}")
+            spec = _SIMPLE_BLOCKS.get(block_type)
+            if spec is not None:
+                prefix, trailing_blank = spec
+                text_content = self._extract_text_content(block.get(block_type, {}).get("rich_text", []))
+                md_lines.append(prefix + text_content)
+                if trailing_blank:
+                    md_lines.append("")
 
             elif block_type == "code":
                 code_block = block.get("code", {})
@@ -133,48 +152,23 @@ class MarkdownConverter:
                 checkbox = "[x]" if checked else "[ ]"
                 md_lines.append(f"- {checkbox} {text_content}")
 
-            elif block_type == "quote":
-                text_content = self._extract_text_content(block.get("quote", {}).get("rich_text", []))
-                md_lines.append(f"> {text_content}")
-                md_lines.append("")
-
         return "\n".join(md_lines)
     
-    @staticmethod
-    def latex_to_notion(expr: str) -> str:
-        expr = re.sub(r"\\```math([\s\S]*?)\\```", r"\1", expr)
-        expr = re.sub(r"\\begin\{eqnarray\*?\}", r"\\begin{aligned}", expr)
-        expr = re.sub(r"\\end\{eqnarray\*?\}", r"\\end{aligned}", expr)
-        
-        # Fix \mid in \text{} - replace with | in text mode
-        # This handles cases like \text{mặt 6 \mid mặt chẵn}
-        # We need to replace \mid with | when inside \text{}
-        def fix_mid_in_text(match):
-            text_content = match.group(1)
-            # Replace \mid with | inside text
-            text_content = text_content.replace(r'\mid', '|')
-            return f'\\text{{{text_content}}}'
-        
-        expr = re.sub(r'\\text\{([^}]*)\}', fix_mid_in_text, expr)
-        
-        converted = expr.strip()
-
-        return converted
+    # Pure string-to-string transform: solutions repeat the same expressions
+    # across lines, so memoizing skips the regex work on every repeat
+    latex_to_notion = staticmethod(_latex_to_notion)
 
     def markdown_latex_to_notion_blocks(self, content: str) -> List[Dict[str, Any]]:
         blocks: List[Dict[str, Any]] = []
-        block_pattern = re.compile(r"```math(.*?)```", re.DOTALL)
-        display_pattern = re.compile(r"\\```math(.*?)\\```", re.DOTALL)
-        inline_pattern = re.compile(r"\$(.+?)\$")
         pos = 0
-        for m in re.finditer(r"```math.*?```|\\```math.*?\\```", content, re.DOTALL):
+        for m in _MATH_ANY.finditer(content):
             # Text before block
             if m.start() > pos:
                 text_chunk = content[pos:m.start()]
-                blocks.extend(self._process_inline_lines(text_chunk, inline_pattern))
-            
+                blocks.extend(self._process_inline_lines(text_chunk, _INLINE))
+
             expr = m.group(0)
-            expr_clean = (block_pattern.match(expr) or display_pattern.match(expr)).group(1).strip()
+            expr_clean = (_MATH_BLOCK.match(expr) or _MATH_DISPLAY.match(expr)).group(1).strip()
             expr_clean = MarkdownConverter.latex_to_notion(expr_clean)
             blocks.append({
                 "object": "block",
@@ -186,7 +180,7 @@ class MarkdownConverter:
         # --- Handle the remainder after last math block ---
         if pos < len(content):
             text_chunk = content[pos:]
-            blocks.extend(self._process_inline_lines(text_chunk, inline_pattern))
+            blocks.extend(self._process_inline_lines(text_chunk, _INLINE))
 
         return blocks
 
@@ -200,34 +194,26 @@ class MarkdownConverter:
             # Check if line contains inline LaTeX ($...$)
             if inline_pattern.search(line):
                 parts = []
-                last_idx = 0
-                for m in inline_pattern.finditer(line):
-                    if m.start() > last_idx:
-                        text_before = line[last_idx:m.start()].strip()
-                        if text_before:
-                            parts.append({
-                                "type": "text",
-                                "text": {"content": text_before}
-                            })
-                    expr = m.group(1).strip()
+                # Capturing split gives alternating [text, math, text, ...]
+                # in one scan — no last_idx arithmetic or repeated slicing
+                for idx, chunk in enumerate(inline_pattern.split(line)):
+                    chunk = chunk.strip()
+                    if not chunk:
+                        continue
+                    if idx % 2 == 0:
+                        parts.append({
+                            "type": "text",
+                            "text": {"content": chunk}
+                        })
+                        continue
                     # Clean up the expression - remove $ delimiters if present
-                    import re
-                    expr = re.sub(r'^\$|\$$', '', expr).strip()
-                    expr = self.latex_to_notion(expr) 
+                    expr = _DOLLAR_EDGES.sub('', chunk).strip()
+                    expr = self.latex_to_notion(expr)
                     if expr:  # Only add if expression is not empty
                         parts.append({
                             "type": "equation",
                             "equation": {"expression": expr}
                         })
-                    last_idx = m.end()
-
-                if last_idx < len(line):
-                    text_after = line[last_idx:].strip()
-                    if text_after:
-                        parts.append({
-                            "type": "text",
-                            "text": {"content": text_after}
-                        })
 
                 if len(parts) == 1 and "equation" in parts[0]:
                     blocks.append({
@@ -254,4 +240,5 @@ class MarkdownConverter:
     def _extract_text_content(self, rich_text_list):
         if not rich_text_list:
             return ""
-        return "".join([rt.get("text", {}).get("content", "") for rt in rich_text_list if "text" in rt])    
\ No newline at end of file
+        # Generator feeds str.join directly without an intermediate list
+        return "".join(rt.get("text", {}).get("content", "") for rt in rich_text_list if "text" in rt)
\ No newline at end of file
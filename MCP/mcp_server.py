@@ -85,86 +85,93 @@ class MCPServer:
         if not name:
             self._send_error(-32602, "Invalid params: name is required", rid)
             return
+        if name not in ("search_notion", "create_page", "update_page", "query_database"):
+            self._send_result(
+                {"content": [{"type": "text", "text": f"Unknown tool: {name}"}], "isError": True},
+                rid
+            )
+            return
 
         try:
-            if name == "search_notion":
-                query = arguments.get("query", "")
-                filt = arguments.get("filter")
-                filter_dict = {"object": filt} if filt else None
-                results = self.notion.search(query=query, filter=filter_dict)
-                self._send_tool_result(results, rid)
-
-            elif name == "create_page":
-                parent_id = arguments.get("parent_id")
-                title = arguments.get("title", "")
-                properties = arguments.get("properties", {})
-                content = arguments.get("content", "")
-
-                page_properties = {
-                    "title": {"title": [{"text": {"content": title}}]}
-                }
-                if properties:
-                    page_properties.update(properties)
-
-                # Parent có thể là page hoặc database
-                parent = {"page_id": parent_id} if len(parent_id) == 32 else {"database_id": parent_id}
-
-                new_page = self.notion.pages.create(parent=parent, properties=page_properties)
-
-                # Nếu có content markdown thì thêm vào
-                if content:
-                    blocks = self._markdown_to_blocks(content)
-                    if blocks:
-                        self.notion.blocks.children.append(
-                            block_id=new_page["id"],
-                            children=blocks
-                        )
-
-                self._send_tool_result(new_page, rid)
-
-            elif name == "update_page":
-                page_id = arguments.get("page_id")
-                title = arguments.get("title")
-                properties = arguments.get("properties", {})
-
-                update_data = {}
-                if title:
-                    update_data["properties"] = {
-                        "title": {
-                            "title": [{"text": {"content": title}}]
-                        }
+            self._send_tool_result(self.execute_tool(name, arguments), rid)
+        except APIResponseError as e:
+            self._send_result({"content": [{"type": "text", "text": f"Notion API error: {str(e)}"}], "isError": True}, rid)
+        except Exception as e:
+            self._send_result({"content": [{"type": "text", "text": f"Error: {str(e)}"}], "isError": True}, rid)
+
+    def execute_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """Chạy một tool và trả về kết quả thô.
+
+        Shared by the JSON-RPC handler above and by in-process callers that
+        skip the stdio transport entirely.
+        """
+        if name == "search_notion":
+            query = arguments.get("query", "")
+            filt = arguments.get("filter")
+            filter_dict = {"object": filt} if filt else None
+            return self.notion.search(query=query, filter=filter_dict)
+
+        elif name == "create_page":
+            parent_id = arguments.get("parent_id")
+            title = arguments.get("title", "")
+            properties = arguments.get("properties", {})
+            content = arguments.get("content", "")
+
+            page_properties = {
+                "title": {"title": [{"text": {"content": title}}]}
+            }
+            if properties:
+                page_properties.update(properties)
+
+            # Parent có thể là page hoặc database
+            parent = {"page_id": parent_id} if len(parent_id) == 32 else {"database_id": parent_id}
+
+            new_page = self.notion.pages.create(parent=parent, properties=page_properties)
+
+            # Nếu có content markdown thì thêm vào
+            if content:
+                blocks = self._markdown_to_blocks(content)
+                if blocks:
+                    self.notion.blocks.children.append(
+                        block_id=new_page["id"],
+                        children=blocks
+                    )
+
+            return new_page
+
+        elif name == "update_page":
+            page_id = arguments.get("page_id")
+            title = arguments.get("title")
+            properties = arguments.get("properties", {})
+
+            update_data = {}
+            if title:
+                update_data["properties"] = {
+                    "title": {
+                        "title": [{"text": {"content": title}}]
                     }
-                if properties:
-                    update_data.setdefault("properties", {}).update(properties)
+                }
+            if properties:
+                update_data.setdefault("properties", {}).update(properties)
 
-                updated_page = self.notion.pages.update(page_id=page_id, **update_data)
-                self._send_tool_result(updated_page, rid)
+            return self.notion.pages.update(page_id=page_id, **update_data)
 
-            elif name == "query_database":
-                database_id = arguments["database_id"]
-                filter_criteria = arguments.get("filter")
-                sorts = arguments.get("sorts")
-                page_size = min(arguments.get("page_size", 50), 100)
+        elif name == "query_database":
+            database_id = arguments["database_id"]
+            filter_criteria = arguments.get("filter")
+            sorts = arguments.get("sorts")
+            page_size = min(arguments.get("page_size", 50), 100)
 
-                query_params = {"database_id": database_id}
-                if filter_criteria:
-                    query_params["filter"] = filter_criteria
-                if sorts:
-                    query_params["sorts"] = sorts
-                query_params["page_size"] = page_size
+            query_params = {"database_id": database_id}
+            if filter_criteria:
+                query_params["filter"] = filter_criteria
+            if sorts:
+                query_params["sorts"] = sorts
+            query_params["page_size"] = page_size
 
-                results = self.notion.databases.query(**query_params)
-                self._send_tool_result(results, rid)
+            return self.notion.databases.query(**query_params)
 
-            else:
-                self._send_result(
-                    {"content": [{"type": "text", "text": f"Unknown tool: {name}"}], "isError": True},
-                    rid
-                )
-        except APIResponseError as e:
-            self._send_result({"content": [{"type": "text", "text": f"Notion API error: {str(e)}"}], "isError": True}, rid)
-        except Exception as e:
-            self._send_result({"content": [{"type": "text", "text": f"Error: {str(e)}"}], "isError": True}, rid)
+        raise ValueError(f"Unknown tool: {name}")
 
     #  Tool definitions 
     def _get_tools(self) -> List[Dict[str, Any]]:
@@ -2,12 +2,14 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
 import re
+import uuid
 import asyncio
 import json
 import httpx
 import logging
 import subprocess
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from mcp.server import NotificationOptions
 from mcp.server.models import InitializationOptions
@@ -18,6 +20,18 @@ from dotenv import load_dotenv
 load_dotenv()
 import mcp.client.sse as sse
 
+# orjson decodes large Notion payloads several times faster than stdlib
+# json; fall back silently when not installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps  # returns bytes, ready for content=
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
@@ -30,37 +44,105 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("notion-mcp-client")
 
 
+# Compiled once: extract_uuid runs per block in larger loops
+_UUID_DASHED_RE = re.compile(r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})", re.IGNORECASE)
+_UUID_HEX_RE = re.compile(r"([0-9a-f]{32})", re.IGNORECASE)
+
+
 def extract_uuid(resource_uri: str) -> str:
     """Extract UUID from resource URI - handles both formats"""
+    # Fast path: already a bare hyphenated UUID
+    if len(resource_uri) == 36 and resource_uri[8] == "-":
+        return resource_uri
+
     # Try to find UUID with dashes first (standard format)
-    uuid_with_dashes = re.search(r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})", resource_uri, re.IGNORECASE)
+    uuid_with_dashes = _UUID_DASHED_RE.search(resource_uri)
     if uuid_with_dashes:
         return uuid_with_dashes.group(1)
-    
-    # Try to find 32 hex chars (without dashes)
-    match = re.search(r"([0-9a-f]{32})", resource_uri, re.IGNORECASE)
+
+    # Try to find 32 hex chars (without dashes); uuid.UUID hyphenates in C
+    match = _UUID_HEX_RE.search(resource_uri)
     if match:
-        s = match.group(1)
-        return f"{s[0:8]}-{s[8:12]}-{s[12:16]}-{s[16:20]}-{s[20:]}"
-    
+        return str(uuid.UUID(hex=match.group(1)))
+
     # If no match, return as-is (might already be a valid UUID)
     return resource_uri
 
 
+def _build_http_client(notion_token: str) -> httpx.AsyncClient:
+    """Build a keep-alive HTTP client for the Notion REST API.
+
+    Connection pooling keeps TLS handshakes off the per-request path; HTTP/2
+    multiplexing is enabled when the optional h2 package is available.
+    """
+    kwargs = {
+        "headers": {
+            "Authorization": f"Bearer {notion_token}",
+            "Notion-Version": "2022-06-28",
+            "Content-Type": "application/json",
+        },
+        "timeout": httpx.Timeout(120.0),
+        "limits": httpx.Limits(
+            max_connections=32,
+            max_keepalive_connections=32,
+            keepalive_expiry=60.0,
+        ),
+    }
+    try:
+        return httpx.AsyncClient(http2=True, **kwargs)
+    except ImportError:
+        # h2 not installed; keep-alive HTTP/1.1 pooling still applies
+        return httpx.AsyncClient(**kwargs)
+
+
+# Shared clients keyed by (token, running loop) so repeated constructions
+# reuse one pool per loop: pooled connections belong to the loop that opened
+# them, and callers like the Flask app run a fresh asyncio.run per request
+_shared_http_clients: Dict[Any, httpx.AsyncClient] = {}
+
+def _get_shared_http_client(notion_token: str) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    key = (notion_token, loop)
+    client = _shared_http_clients.get(key)
+    if client is None or client.is_closed:
+        # Evict pools whose owning loop has closed; their connections are
+        # already dead and can only be garbage-collected
+        for stale in [k for k in _shared_http_clients if k[1].is_closed()]:
+            del _shared_http_clients[stale]
+        client = _build_http_client(notion_token)
+        _shared_http_clients[key] = client
+    return client
+
+
+async def close_shared_http_clients():
+    """Close the running loop's shared Notion HTTP pools (call on shutdown)."""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _shared_http_clients if k[1] is loop]:
+        client = _shared_http_clients.pop(key)
+        if not client.is_closed:
+            await client.aclose()
+
+
 class NotionMCPClient:
     def __init__(self, server_path: str, notion_token: str):
         self.server_path = server_path
         self.notion_token = notion_token
         self.session: Optional[ClientSession] = None
-        self.client = httpx.AsyncClient(
-            headers={
-                "Authorization": f"Bearer {self.notion_token}",
-                "Notion-Version": "2022-06-28",
-                "Content-Type": "application/json",
-            },
-            timeout=httpx.Timeout(120.0)
-        )
-        
+        # Set when the MCP server runs inside this interpreter; tool calls
+        # then bypass the JSON-RPC transport entirely
+        self._inproc = None
+        # Memoized page reads keyed by id -> (last_edited_time, body).
+        # The cheap metadata GET validates the entry, so a repeat read of an
+        # unchanged page skips the block fetch and reparse entirely
+        self._page_cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._page_cache_max = 256
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Resolved lazily so each running loop gets its own pool; always
+        # accessed from async methods, where a loop is guaranteed
+        return _get_shared_http_client(self.notion_token)
+
     @asynccontextmanager
     async def connect(self):
         """Connect to the Notion MCP server (auto-detect SSE vs STDIO)"""
@@ -77,7 +159,21 @@ class NotionMCPClient:
                     self.session = session
                     yield self
         else:
-            # STDIO MODE
+            # IN-PROCESS MODE: when the bundled server module is importable,
+            # run it inside this interpreter — no subprocess startup and no
+            # JSON-RPC framing per tool call
+            if os.path.basename(self.server_path) == "mcp_server.py":
+                server = self._build_inproc_server()
+                if server is not None:
+                    logger.info("Running MCP server in-process")
+                    self._inproc = server
+                    try:
+                        yield self
+                    finally:
+                        self._inproc = None
+                    return
+
+            # STDIO MODE (subprocess fallback)
             logger.info(f"Starting server process via stdio: {self.server_path}")
             server_params = StdioServerParameters(
                 command=sys.executable,
@@ -89,21 +185,44 @@ class NotionMCPClient:
                     await session.initialize()
                     self.session = session
                     yield self
-    
+
+    def _build_inproc_server(self):
+        """Instantiate the bundled MCPServer for direct calls, or None."""
+        try:
+            try:
+                from .mcp_server import MCPServer
+            except ImportError:
+                from mcp_server import MCPServer
+            return MCPServer(token=self.notion_token)
+        except Exception as e:
+            logger.warning(f"In-process server unavailable ({e}); falling back to stdio")
+            return None
+
+    @asynccontextmanager
+    async def connect_inproc(self):
+        """Connect with the server running in this interpreter (no fallback)."""
+        server = self._build_inproc_server()
+        if server is None:
+            raise RuntimeError("In-process MCP server unavailable")
+        self._inproc = server
+        try:
+            yield self
+        finally:
+            self._inproc = None
+
+
     async def list_resources(self):
         try:
             payload = {"query": ""}
 
+            # Auth and version headers are client defaults — no per-call dict;
+            # content= skips httpx's stdlib json serializer
             response = await self.client.post(
                 "https://api.notion.com/v1/search",
-                json=payload,
-                headers={
-                    "Authorization": f"Bearer {self.notion_token}",
-                    "Notion-Version": "2022-06-28"
-                }
+                content=_json_dumps(payload),
             )
             response.raise_for_status()
-            data = response.json()
+            data = _json_loads(response.content)
 
             # Lấy danh sách resources (pages/databases)
             resources = data.get("results", [])
@@ -112,24 +231,50 @@ class NotionMCPClient:
             logger.error(f"Error listing resources: {e}")
             raise
 
+    async def _iter_children(self, block_id: str):
+        """Yield all child blocks, following cursor pagination.
+
+        Blocks stream out as each page of 100 arrives, so callers start
+        processing immediately and never hold more than one page in memory.
+        """
+        cursor = None
+        while True:
+            params = {"page_size": 100}
+            if cursor:
+                params["start_cursor"] = cursor
+            resp = await self.client.get(
+                f"https://api.notion.com/v1/blocks/{block_id}/children",
+                params=params,
+            )
+            resp.raise_for_status()
+            blocks_page = _json_loads(resp.content)
+            for block in blocks_page.get("results", []):
+                yield block
+            if not blocks_page.get("has_more"):
+                break
+            cursor = blocks_page.get("next_cursor")
+
     async def read_resource(self, resource_uri: str):
         resource_id = extract_uuid(resource_uri)
 
         # 1. Lấy metadata của page
         try:
             page_resp = await self.client.get(
-                f"https://api.notion.com/v1/pages/{resource_id}",
-                headers={
-                    "Authorization": f"Bearer {self.notion_token}",
-                    "Notion-Version": "2022-06-28"
-                }
+                f"https://api.notion.com/v1/pages/{resource_id}"
             )
             page_resp.raise_for_status()
-            page_data = page_resp.json()
+            page_data = _json_loads(page_resp.content)
         except Exception as e:
             logger.error(f"Error fetching page metadata: {e}")
             return ""
 
+        # Cache hit: page unchanged since the cached read
+        last_edited = page_data.get("last_edited_time", "")
+        cached = self._page_cache.get(resource_id)
+        if cached is not None and cached[0] == last_edited:
+            self._page_cache.move_to_end(resource_id)
+            return cached[1]
+
         # Lấy title
         title = ""
         properties = page_data.get("properties", {})
@@ -142,55 +287,53 @@ class NotionMCPClient:
 
         print(f"\nTitle: {title}\n")
 
-        # 2. Lấy nội dung block của page
-        try:
-            blocks_resp = await self.client.get(
-                f"https://api.notion.com/v1/blocks/{resource_id}/children?page_size=100",
-                headers={
-                    "Authorization": f"Bearer {self.notion_token}",
-                    "Notion-Version": "2022-06-28"
-                }
-            )
-            blocks_resp.raise_for_status()
-            blocks_data = blocks_resp.json()
-        except Exception as e:
-            logger.error(f"Error fetching blocks content: {e}")
-            return ""
-
+        # 2. Lấy nội dung block của page, streaming qua cursor pagination
+        # nên page dài hơn 100 block không còn bị cắt
         print("Content Blocks:")
         lines: List[str] = []
-        for block in blocks_data.get("results", []):
-            btype = block.get("type")
-            bcontent = block.get(btype, {}) or {}
-            content = ""
-
-            if "rich_text" in bcontent:
-                content = "".join(rt.get("plain_text", "") for rt in bcontent["rich_text"])
-            elif "text" in bcontent:
-                content = "".join(rt.get("plain_text", "") for rt in bcontent["text"])
-            elif btype == "equation": 
-                content = bcontent.get("expression", "")
-            elif btype == "unsupported":
-                content = f"[UNSUPPORTED] {json.dumps(block, ensure_ascii=False)}"
-            elif btype == "image":
-                img_type = bcontent.get("type")
-                if img_type == "external":
-                    content = bcontent.get("external", {}).get("url", "")
-                elif img_type == "file":
-                    content = bcontent.get("file", {}).get("url", "")
+        try:
+            async for block in self._iter_children(resource_id):
+                btype = block.get("type")
+                bcontent = block.get(btype, {}) or {}
+                content = ""
+
+                if "rich_text" in bcontent:
+                    content = "".join(rt.get("plain_text", "") for rt in bcontent["rich_text"])
+                elif "text" in bcontent:
+                    content = "".join(rt.get("plain_text", "") for rt in bcontent["text"])
+                elif btype == "equation":
+                    content = bcontent.get("expression", "")
+                elif btype == "unsupported":
+                    content = f"[UNSUPPORTED] {json.dumps(block, ensure_ascii=False)}"
+                elif btype == "image":
+                    img_type = bcontent.get("type")
+                    if img_type == "external":
+                        content = bcontent.get("external", {}).get("url", "")
+                    elif img_type == "file":
+                        content = bcontent.get("file", {}).get("url", "")
+                    else:
+                        content = "[image with unknown type]"
                 else:
-                    content = "[image with unknown type]"
-            else:
-                content = f"[{btype}]"
+                    content = f"[{btype}]"
 
-            print(f"- {btype}: {content}")
-            if content:
-                lines.append(content)
+                print(f"- {btype}: {content}")
+                if content:
+                    lines.append(content)
+        except Exception as e:
+            logger.error(f"Error fetching blocks content: {e}")
+            return ""
 
-        return (title + "\n\n" + "\n".join(lines)).strip()
+        body = (title + "\n\n" + "\n".join(lines)).strip()
+        self._page_cache[resource_id] = (last_edited, body)
+        self._page_cache.move_to_end(resource_id)
+        if len(self._page_cache) > self._page_cache_max:
+            self._page_cache.popitem(last=False)
+        return body
  
     async def list_tools(self) -> List[Dict[str, Any]]:
         """List all available tools"""
+        if self._inproc is not None:
+            return self._inproc._get_tools()
         if not self.session:
             raise RuntimeError("Client not connected")
         
@@ -205,7 +348,16 @@ class NotionMCPClient:
         """Call a tool with the given arguments"""
         arguments = {k: v for k, v in arguments.items() if v is not None}
         logger.debug(f"Final arguments sent to tool {name}: {arguments}")
-            
+
+        if self._inproc is not None:
+            # Direct call: notion_client is synchronous, so run it off the
+            # event loop; errors mirror the stdio transport's text replies
+            try:
+                return await asyncio.to_thread(self._inproc.execute_tool, name, arguments)
+            except Exception as e:
+                logger.error(f"In-process tool error: {e}")
+                return f"Error: {e}"
+
         result = await self.session.call_tool(name, arguments)
         # Return the full result object, not just text
         if result.content:
@@ -213,7 +365,7 @@ class NotionMCPClient:
             # Try to parse as JSON if it looks like JSON
             try:
                 if text_result.strip().startswith('{'):
-                    return json.loads(text_result)
+                    return _json_loads(text_result)
             except:
                 pass
             return text_result
@@ -257,7 +409,7 @@ class NotionMCPClient:
                 elif isinstance(result, str):
                     # Try to parse as JSON
                     try:
-                        page_data = json.loads(result)
+                        page_data = _json_loads(result)
                         if isinstance(page_data, dict):
                             page_id = page_data.get("id")
                     except:
@@ -347,7 +499,7 @@ class NotionMCPClient:
                     # Append validated blocks
                     append_resp = await self.client.patch(
                         f"https://api.notion.com/v1/blocks/{page_id}/children",
-                        json={"children": valid_blocks}
+                        content=_json_dumps({"children": valid_blocks})
                     )
                     append_resp.raise_for_status()
                     return f"Page created with {len(valid_blocks)} blocks."
@@ -458,26 +610,33 @@ class NotionMCPClient:
                 return f"Page {page_id} updated (no valid content blocks)."
 
             if mode == "edit":
-                existing_blocks_resp = await self.client.get(
-                    f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
-                )
-                existing_blocks_resp.raise_for_status()
-                existing_blocks = existing_blocks_resp.json().get("results", [])
+                # 1. Collect every existing block id first: deleting while the
+                # listing is still paginating can invalidate the cursor and
+                # skip blocks, leaving stale content behind
+                del_ids: List[str] = [blk["id"] async for blk in self._iter_children(page_id)]
 
-                # 2. Delete all
-                for blk in existing_blocks:
-                    blk_id = blk["id"]
-                    try:
+                # 2. Then delete concurrently; the semaphore keeps us under
+                # Notion's rate limit
+                del_sem = asyncio.Semaphore(8)
+
+                async def _delete_block(blk_id: str):
+                    async with del_sem:
                         del_resp = await self.client.delete(f"https://api.notion.com/v1/blocks/{blk_id}")
                         del_resp.raise_for_status()
-                    except Exception as e:
-                        logger.warning(f"Couldn't delete block {blk_id}: {e}")
+
+                del_results = await asyncio.gather(
+                    *(_delete_block(blk_id) for blk_id in del_ids),
+                    return_exceptions=True,
+                )
+                for blk_id, res in zip(del_ids, del_results):
+                    if isinstance(res, Exception):
+                        logger.warning(f"Couldn't delete block {blk_id}: {res}")
 
                 # 3. Append blocks with error details
                 try:
                     append_resp = await self.client.patch(
                         f"https://api.notion.com/v1/blocks/{page_id}/children",
-                        json={"children": valid_blocks}
+                        content=_json_dumps({"children": valid_blocks})
                     )
                     append_resp.raise_for_status()
                     return f"Page {page_id} content replaced ({len(valid_blocks)} blocks)."
@@ -495,7 +654,7 @@ class NotionMCPClient:
                 try:
                     append_resp = await self.client.patch(
                         f"https://api.notion.com/v1/blocks/{page_id}/children",
-                        json={"children": valid_blocks}
+                        content=_json_dumps({"children": valid_blocks})
                     )
                     append_resp.raise_for_status()
                     return f"Page {page_id} appended with {len(valid_blocks)} new blocks."
@@ -529,7 +688,14 @@ class NotionMCPClient:
         return await self.call_tool("query_database", arguments)
 
     async def aclose(self):
-        await self.client.aclose()
+        """Close this token's pool for the current loop only.
+
+        Pools on other loops stay untouched, so other live clients are safe.
+        """
+        key = (self.notion_token, asyncio.get_running_loop())
+        client = _shared_http_clients.pop(key, None)
+        if client is not None and not client.is_closed:
+            await client.aclose()
 
 
 class NotionMCPCLI:
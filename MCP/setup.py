@@ -10,6 +10,8 @@ setup(
         "notion-client>=2.2.1",
         "mcp>=0.5.0",
         "asyncio-compat>=0.1.2",
+        "h2>=4.1.0",
+        "orjson>=3.9.0",
     ],
     python_requires=">=3.8",
     entry_points={
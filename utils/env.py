@@ -0,0 +1,14 @@
+import pathlib
+import functools
+
+
+@functools.cache
+def load_env_once() -> None:
+    """Parse the project-root .env a single time per process.
+
+    Several agent modules load environment variables at import; caching the
+    call avoids re-reading and re-parsing the file for every import.
+    """
+    from dotenv import load_dotenv
+    root = pathlib.Path(__file__).resolve().parents[1]
+    load_dotenv(dotenv_path=root / ".env")